@@ -4,6 +4,41 @@ Module for managing and interacting with the 'adds' table in the database.
 This module defines the Add class, which represents an add entity. It includes methods for initializing
 an add instance, creating a new addvert in the database, and retrieving add information from the database
 """
+import csv
+import io
+import sys
+from collections import namedtuple
+from itertools import islice
+
+from psycopg2.extras import execute_values
+
+from .db import db
+
+# All statements are built once at import time. psycopg2 uses the 'format' parameter style and
+# "text", "interval" and "time" are keywords in PostgreSQL, so they are always quoted.
+_PLACEHOLDER = '%s'
+_COLUMNS = ('login', 'chat_id', '"text"', '"interval"', '"time"')
+_COLUMN_LIST = ', '.join(_COLUMNS)
+_VALUES = ', '.join([_PLACEHOLDER] * len(_COLUMNS))
+
+_INSERT_ADD_SQL = sys.intern(f'INSERT INTO adds ({_COLUMN_LIST}) VALUES ({_VALUES}) RETURNING id;')
+_BULK_INSERT_ADD_SQL = sys.intern(f'INSERT INTO adds ({_COLUMN_LIST}) VALUES {_PLACEHOLDER};')
+_COPY_ADDS_SQL = sys.intern(f'COPY adds ({_COLUMN_LIST}) FROM STDIN WITH (FORMAT CSV);')
+_UPDATE_ADDS_SQL = sys.intern(
+    f'UPDATE adds SET {", ".join(f"{column} = v.{column}" for column in _COLUMNS)} '
+    f'FROM (VALUES {_PLACEHOLDER}) AS v (id, {_COLUMN_LIST}) WHERE adds.id = v.id;'
+)
+_UPDATE_ADDS_TEMPLATE = (f'({_PLACEHOLDER}::integer, {_PLACEHOLDER}, {_PLACEHOLDER}::bigint, '
+                         f'{_PLACEHOLDER}, {_PLACEHOLDER}::add_interval, {_PLACEHOLDER})')
+_DELETE_ADDS_SQL = sys.intern(f'DELETE FROM adds WHERE id = ANY({_PLACEHOLDER});')
+_SELECT_ADDS_SQL = sys.intern(f'SELECT id, {_COLUMN_LIST} FROM adds;')
+_SELECT_DUE_ADDS_SQL = sys.intern(f'SELECT id, {_COLUMN_LIST} FROM adds WHERE "time" = {_PLACEHOLDER};')
+
+# Read-only view of a row of the 'adds' table
+AddRow = namedtuple('AddRow', 'id login chat_id text interval time')
+
+# Values of an add, which has not been filled in yet
+_EMPTY_ADD = (None,) * 6
 
 
 class Add:
@@ -20,8 +55,20 @@ class Add:
 
       Methods:
       - __init__(self, add=None): Initializes an instance of the Add class.
-      - create_new_add(self, cursor, connection): Creates a new addvert in the database.
+      - empty(cls): Creates an instance of the Add class with all attributes set to None.
+      - from_row(cls, row): Creates an instance of the Add class from a database row.
+      - create_new_add(self, cursor=None, connection=None, commit=True): Creates a new addvert in the database.
+      - bulk_insert(cls, cursor, connection, adds, batch_size=1000): Inserts many adverts in batches.
+      - copy_insert(cls, connection, adds): Loads many adverts using the COPY command.
+      - update_many(cls, cursor, connection, adds): Updates many adverts with a single statement.
+      - delete_many(cls, cursor, connection, ids): Deletes many adverts with a single statement.
+      - rows(cls, cursor): Retrieves all adverts from the database as read-only rows.
+      - iter_rows(cls, cursor): Lazily iterates over all adverts as read-only rows.
+      - due_now(cls, cursor, now_hhmm): Retrieves the adverts, which must be sent at the given time.
+      - iter_due(cls, cursor, now_hhmm): Lazily iterates over the adverts, which must be sent at the given time.
       """
+    __slots__ = ('id', 'login', 'chat_id', 'text', 'interval', 'time')
+
     def __init__(self, add=None):
         """
          Initialize an instance of the Add class.
@@ -30,35 +77,193 @@ class Add:
          - add (tuple, optional): A tuple containing add information retrieved from the database (default=None).
 
          If `add` is provided, the instance is initialized with the values from the tuple.
-         Otherwise, the instance is created with attributes set to None.
+         Otherwise, the attributes are left unset and must be assigned before they are read
+         (use `empty` to get an instance with all attributes set to None).
          """
         if add:
-            self.id = add[0]
-            self.login = add[1]
-            self.chat_id = add[2]
-            self.text = add[3]
-            self.interval = add[4]
-            self.time = add[5]
-        else:
-            self.id = None
-            self.login = None
-            self.chat_id = None
-            self.text = None
-            self.interval = None
-            self.time = None
-
-    def create_new_add(self, cursor, connection):
+            self.id, self.login, self.chat_id, self.text, self.interval, self.time = add
+
+    @classmethod
+    def empty(cls):
+        """
+          Create an instance of the Add class with all attributes set to None.
+
+          Returns:
+          - Add: The empty add.
+          """
+        return cls(_EMPTY_ADD)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+          Create an instance of the Add class from a row of the 'adds' table.
+
+          Parameters:
+          - row (tuple): A tuple containing add information retrieved from the database.
+
+          Returns:
+          - Add: The add filled in with the values from the row.
+          """
+        return cls(row)
+
+    def create_new_add(self, cursor=None, connection=None, commit=True):
         """
           Create a new addvert in the database.
 
+          Parameters:
+          - cursor (optional): Database cursor object (default=one on a connection borrowed from the pool,
+            see `helpers.db.db`).
+          - connection (optional): Database connection object (default=one borrowed from the pool).
+          - commit (bool, optional): Whether to commit the changes right away (default=True).
+
+          Returns:
+          - int: The unique identifier assigned to the add by the database.
+
+          Inserts a new add into the 'adds' table with the attributes of the current instance and stores
+          the generated ID in `id`. Pass `commit=False` when the insert is a part of a bigger transaction
+          (see `helpers.db.transaction`).
+          """
+        if cursor is None or connection is None:
+            # the insert is committed at the end of the block
+            with db() as (connection, cursor):
+                return self.create_new_add(cursor, connection, commit=False)
+        cursor.execute(_INSERT_ADD_SQL, (self.login, self.chat_id, self.text, self.interval, self.time))
+        self.id = cursor.fetchone()[0]
+        if commit:
+            connection.commit()
+        return self.id
+
+    @classmethod
+    def bulk_insert(cls, cursor, connection, adds, batch_size=1000):
+        """
+          Insert many adverts into the database using a single multi-row INSERT per batch.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - connection: Database connection object.
+          - adds (iterable): Instances of the Add class to be inserted.
+          - batch_size (int, optional): Maximum number of rows sent in one INSERT (default=1000).
+
+          The changes are committed once per batch instead of once per add.
+          """
+        adds = iter(adds)
+        while batch := list(islice(adds, batch_size)):
+            rows = [(add.login, add.chat_id, add.text, add.interval, add.time) for add in batch]
+            execute_values(cursor, _BULK_INSERT_ADD_SQL, rows, page_size=batch_size)
+            connection.commit()
+
+    @classmethod
+    def copy_insert(cls, connection, adds):
+        """
+          Load many adverts into the database through the COPY command of PostgreSQL.
+
+          Parameters:
+          - connection: Database connection object.
+          - adds (iterable): Instances of the Add class to be inserted.
+
+          The adds are written into an in-memory CSV buffer, which is streamed to the server in one command.
+          It is the fastest way to import a large number of adds. Commits the changes to the database.
+          """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows((add.login, add.chat_id, add.text, add.interval, add.time) for add in adds)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(_COPY_ADDS_SQL, buffer)
+        connection.commit()
+
+    @classmethod
+    def update_many(cls, cursor, connection, adds):
+        """
+          Update many adverts in the database using a single UPDATE statement.
+
           Parameters:
           - cursor: Database cursor object.
           - connection: Database connection object.
+          - adds (iterable): Instances of the Add class with `id` set, holding the new values.
 
-          Inserts a new add into the 'adds' table with the attributes of the current instance.
+          The new values are sent as one VALUES list joined to the 'adds' table by ID.
           Commits the changes to the database.
           """
-        cursor.execute(f'''
-            INSERT INTO adds (login, chat_id, text, interval, time) VALUES ('{self.login}', '{self.chat_id}', '{self.text}', '{self.interval}', '{self.time}');
-        ''')
+        rows = [(add.id, add.login, add.chat_id, add.text, add.interval, add.time) for add in adds]
+        execute_values(cursor, _UPDATE_ADDS_SQL, rows, template=_UPDATE_ADDS_TEMPLATE, page_size=len(rows) or 1)
         connection.commit()
+
+    @classmethod
+    def delete_many(cls, cursor, connection, ids):
+        """
+          Delete many adverts from the database using a single DELETE statement.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - connection: Database connection object.
+          - ids (iterable): Unique identifiers of the adds to be deleted.
+
+          Returns:
+          - int: The number of deleted adds.
+
+          Commits the changes to the database.
+          """
+        cursor.execute(_DELETE_ADDS_SQL, (list(ids),))
+        connection.commit()
+        return cursor.rowcount
+
+    @classmethod
+    def rows(cls, cursor):
+        """
+          Retrieve all adverts from the 'adds' table.
+
+          Parameters:
+          - cursor: Database cursor object.
+
+          Returns:
+          - list: AddRow named tuples, one per add.
+
+          Meant for code which only reads the adds, so no Add instances are created.
+          """
+        return list(cls.iter_rows(cursor))
+
+    @classmethod
+    def iter_rows(cls, cursor):
+        """
+          Lazily iterate over all adverts from the 'adds' table.
+
+          Parameters:
+          - cursor: Database cursor object.
+
+          Yields:
+          - AddRow: Named tuple for each add, created only when it is reached.
+
+          With a named (server-side) psycopg2 cursor the rows are also fetched from the server
+          in chunks of `cursor.itersize` instead of all at once.
+          """
+        cursor.execute(_SELECT_ADDS_SQL)
+        yield from map(AddRow._make, cursor)
+
+    @classmethod
+    def due_now(cls, cursor, now_hhmm):
+        """
+          Retrieve all adverts, which must be sent at the given time, with a single query.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - now_hhmm (str): The time in the same format as stored in the 'time' column (e.g. '12:30').
+
+          Returns:
+          - list: AddRow named tuples, one per due add.
+          """
+        return list(cls.iter_due(cursor, now_hhmm))
+
+    @classmethod
+    def iter_due(cls, cursor, now_hhmm):
+        """
+          Lazily iterate over the adverts, which must be sent at the given time.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - now_hhmm (str): The time in the same format as stored in the 'time' column (e.g. '12:30').
+
+          Yields:
+          - AddRow: Named tuple for each due add, created only when it is reached.
+          """
+        cursor.execute(_SELECT_DUE_ADDS_SQL, (now_hhmm,))
+        yield from map(AddRow._make, cursor)
@@ -0,0 +1,166 @@
+"""
+Module for loading the configuration of the server.
+
+This module defines the Config class and the load_config function, which reads the JSON configuration file given
+on the command line and checks, that it contains all required keys with values of the right types.
+Parsed files are cached, and orjson is used for parsing when it is installed.
+"""
+import codecs
+import json
+import mmap
+import os
+import stat
+from dataclasses import dataclass
+from types import MappingProxyType
+
+# orjson parses JSON many times faster than the standard library, but it is optional
+# (unlike the standard library it also parses any buffer, e.g. a memory-mapped file, without copying it)
+try:
+    from orjson import loads as json_loads
+    _PARSES_BUFFERS = True
+except ImportError:
+    from json import loads as json_loads
+    _PARSES_BUFFERS = False
+
+# Files larger than this (in bytes) are memory-mapped instead of read, smaller ones are not worth the setup
+_MMAP_THRESHOLD = 4096
+
+# Keys of the configuration file (key: (type of the value, whether the key is required))
+_SCHEMA = {
+    'token': (str, True),
+    'db_config': (dict, True),
+    'worker_threads': (int, False),
+    'webhook_url': (str, False),
+    'webhook_host': (str, False),
+    'webhook_port': (int, False),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """
+    Represents the validated configuration of the server.
+
+    Attributes:
+    - token (str): The token of the Telegram bot.
+    - db_config (MappingProxyType): Read-only keyword arguments for `psycopg2.connect` (host, user, database, ...).
+    - worker_threads (int): Number of threads handling the messages (default=4).
+    - webhook_url (str): Public HTTPS address of the webhook, the bot polls Telegram if it is not set (default=None).
+    - webhook_host (str): Address the webhook server listens on (default='127.0.0.1', only the local reverse proxy).
+    - webhook_port (int): Port the webhook server listens on (default=8443).
+    """
+    token: str
+    db_config: MappingProxyType
+    worker_threads: int = 4
+    webhook_url: str = None
+    webhook_host: str = '127.0.0.1'
+    webhook_port: int = 8443
+
+
+def validate_config(config_data):
+    """
+        Check, that parsed configuration data match the schema of the configuration file.
+
+        Parameters:
+        - config_data: The parsed content of the configuration file.
+
+        Raises:
+        - ValueError: If the data are not an object, a required key is missing, a key is unknown
+          or a value has a wrong type.
+        """
+    if not isinstance(config_data, dict):
+        raise ValueError('the configuration must be a JSON object')
+
+    for key, (value_type, required) in _SCHEMA.items():
+        if key not in config_data:
+            if required:
+                raise ValueError(f"missing key '{key}'")
+            continue
+        value = config_data[key]
+        # bool is a subclass of int in Python, but true/false is not a valid number of threads or a port
+        if not isinstance(value, value_type) or (value_type is int and isinstance(value, bool)):
+            raise ValueError(f"'{key}' must be of type {value_type.__name__}")
+
+    unknown_keys = config_data.keys() - _SCHEMA.keys()
+    if unknown_keys:
+        raise ValueError(f"unknown keys {', '.join(sorted(unknown_keys))}")
+
+
+def _parse_mapped(config_file):
+    """
+        Parse a JSON file through a read-only memory mapping of it.
+
+        Parameters:
+        - config_file: The file opened in binary mode.
+
+        Returns:
+        - The parsed content of the file.
+
+        The parser reads the pages of the file straight from the page cache, no copy of the file is made.
+        """
+    with mmap.mmap(config_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = len(codecs.BOM_UTF8) if mapped[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+        with memoryview(mapped)[start:] as view:
+            return json_loads(view)
+
+
+# Parsed configuration files (key - path, value - (modification time of the file in ns, configuration))
+_config_cache = {}
+
+
+def clear_load_config_cache():
+    """
+        Forget all configuration files parsed by `load_config`, so they are read again on the next call.
+        """
+    _config_cache.clear()
+
+
+def load_config(path):
+    """
+        Load configuration data from a JSON file.
+
+        Parameters:
+        - path (str): The path to the JSON configuration file.
+
+        Returns:
+        - Config: The validated configuration data.
+
+        Raises:
+        - SystemExit: If the file is not found (or it is not a regular file), its JSON cannot be parsed or it does not match the schema
+          of the configuration (see `validate_config`). The message is printed to stderr and the exit status is 1.
+
+        The function attempts to open and read the specified JSON file at the given path.
+        If successful, it parses and validates the JSON content and returns the configuration data as a Config.
+        The result is cached, so later calls return it without reading the file until the file is modified.
+        """
+    # the same check as `os.path.isfile`, but the result of the single stat call is also used by the cache
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+        raise SystemExit(f"Error: Configuration file '{path}' not found.")
+
+    # the file is parsed again only if it has been modified since the last call
+    mtime = file_stat.st_mtime_ns
+    cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        # the bytes are parsed directly, without decoding them into a str first (orjson does not accept the BOM,
+        # which some editors write at the beginning of UTF-8 files, so it is skipped)
+        with open(path, 'rb', buffering=0) as config_file:
+            if _PARSES_BUFFERS and file_stat.st_size > _MMAP_THRESHOLD:
+                config_data = _parse_mapped(config_file)
+            else:
+                config_data = json_loads(config_file.read().removeprefix(codecs.BOM_UTF8))
+        validate_config(config_data)
+        # the cached configuration is shared by all callers, so none of them may change it
+        config = Config(**{**config_data, 'db_config': MappingProxyType(config_data['db_config'])})
+        _config_cache[path] = (mtime, config)
+        return config
+    except json.JSONDecodeError:
+        raise SystemExit(f"Error: Unable to parse JSON in '{path}'.")
+    except ValueError as e:
+        raise SystemExit(f"Error: Invalid configuration in '{path}': {e}.")
@@ -0,0 +1,155 @@
+"""
+Module with helpers for managing database sessions and transactions.
+
+This module keeps a pool of database connections shared by all threads of the server. The connections
+are long-lived, so the server-side state of a session (e.g. prepared plans) survives between queries.
+It also defines the transaction context manager, which lets the caller group several writes into a single transaction
+instead of committing after every row.
+"""
+from contextlib import contextmanager
+
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class _SessionConnection(psycopg2.extensions.connection):
+    """
+      Database connection, which is configured by `tune_session` as soon as it is opened.
+
+      The connection is left in autocommit mode, so a read does not keep a transaction open on the server
+      (writes are grouped into transactions by `transaction`).
+
+      Attributes:
+      - prepared (set): Names of the statements already prepared in this session (see `execute_prepared`).
+      """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        with self.cursor() as cursor:
+            tune_session(cursor, self)
+        self.autocommit = True
+
+
+class _DBContext:
+    """
+      Holds the pool of database connections shared by the whole process.
+
+      Attributes:
+      - pool (ThreadedConnectionPool): Pool of connections for the threads of the server, set by `init_pool`.
+      """
+    pool = None
+
+
+def tune_session(cursor, connection):
+    """
+      Configure a freshly opened database session for the write pattern of the bot.
+
+      Parameters:
+      - cursor: Database cursor object.
+      - connection: Database connection object.
+
+      Turns off `synchronous_commit`, so a commit does not wait for its WAL record to be flushed to disk.
+      A crash may lose the last few committed transactions, but it never corrupts the database,
+      which is acceptable for users and scheduled adds.
+      """
+    cursor.execute('SET synchronous_commit TO OFF;')
+    connection.commit()
+
+
+def init_pool(db_config, minconn=2, maxconn=20):
+    """
+      Open the pool of database connections shared by all threads of the server.
+
+      Parameters:
+      - db_config (dict): Keyword arguments for `psycopg2.connect` (host, user, database, ...).
+      - minconn (int, optional): Number of connections opened right away (default=2).
+      - maxconn (int, optional): Maximum number of connections opened at the same time (default=20).
+      """
+    _DBContext.pool = ThreadedConnectionPool(minconn, maxconn, **db_config, connection_factory=_SessionConnection)
+
+
+@contextmanager
+def db(read_only=False):
+    """
+      Borrow a connection from the pool and run the enclosed block inside a single transaction.
+
+      Parameters:
+      - read_only (bool, optional): Whether the block only reads, so it runs without a transaction (default=False).
+
+      Yields:
+      - tuple: The borrowed connection and a new cursor on it.
+
+      Raises:
+      - RuntimeError: If the pool has not been opened by `init_pool`.
+
+      The transaction is committed (or rolled back on an exception) and the cursor is closed when the block
+      finishes. A read-only block runs in autocommit mode, which saves the BEGIN and COMMIT round trips.
+      The connection is always returned to the pool, so keep the block as short as possible.
+      """
+    if _DBContext.pool is None:
+        raise RuntimeError('Database is not configured, call init_pool() first.')
+    connection = _DBContext.pool.getconn()
+    try:
+        if read_only:
+            with connection.cursor() as cursor:
+                yield connection, cursor
+        else:
+            with transaction(connection), connection.cursor() as cursor:
+                yield connection, cursor
+    finally:
+        _DBContext.pool.putconn(connection)
+
+
+def close_pool():
+    """
+      Close all connections of the pool if it has been opened.
+      """
+    if _DBContext.pool is not None:
+        _DBContext.pool.closeall()
+    _DBContext.pool = None
+
+
+def execute_prepared(cursor, name, statement, params):
+    """
+      Execute a statement, which is prepared on the server once per database session.
+
+      Parameters:
+      - cursor: Database cursor object.
+      - name (str): Name of the prepared statement.
+      - statement (str): SQL of the statement with positional parameters ($1, $2, ...).
+      - params (tuple): Values of the parameters.
+
+      The statement is prepared the first time it is executed on the connection of the cursor, so the server
+      parses and plans it only once and every later execution only binds the new values.
+      """
+    prepared = cursor.connection.prepared
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} AS {statement};')
+        prepared.add(name)
+    cursor.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))});', params)
+
+
+@contextmanager
+def transaction(connection):
+    """
+      Run the enclosed block of database operations inside a single transaction.
+
+      Parameters:
+      - connection: Database connection object.
+
+      Commits the changes when the block finishes successfully. If an exception is raised inside the block,
+      the changes are rolled back and the exception is propagated to the caller. A connection in autocommit
+      mode is switched out of it for the time of the block.
+      """
+    autocommit = connection.autocommit
+    connection.autocommit = False
+    try:
+        yield connection
+    except BaseException:
+        connection.rollback()
+        raise
+    else:
+        connection.commit()
+    finally:
+        if autocommit:
+            connection.autocommit = True
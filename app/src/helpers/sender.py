@@ -0,0 +1,184 @@
+"""
+Module for sending messages to Telegram without exceeding its rate limits.
+
+This module defines the RateLimitedSender class, which queues outgoing messages and sends them from a separate
+thread. Messages to the same chat are spaced out, the total number of messages per second is limited, and
+messages rejected by Telegram with HTTP 429 (Too Many Requests) are retried after the requested delay.
+A chat, which has to wait, does not hold back the messages to other chats.
+"""
+import collections
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+
+class RateLimitedSender:
+    """
+    Represents a queue of outgoing messages, which is drained by a dedicated sender thread.
+
+    Attributes:
+    - bot (telebot.TeleBot): The bot used for sending the messages.
+    - per_chat_interval (float): Minimal number of seconds between two messages to the same chat.
+    - global_rate (int): Maximal number of messages sent per second to all chats together.
+    - max_retries (int): How many times a message rejected with HTTP 429 is sent again.
+
+    Methods:
+    - __init__(self, bot, per_chat_interval=1.0, global_rate=30, max_retries=5): Initializes the sender.
+    - send(self, chat_id, text): Queues a text message for sending.
+    - start(self): Starts the sender thread.
+    - stop(self): Sends the already queued messages and stops the sender thread.
+    """
+    def __init__(self, bot, per_chat_interval=1.0, global_rate=30, max_retries=5):
+        """
+          Initialize an instance of the RateLimitedSender class.
+
+          Parameters:
+          - bot (telebot.TeleBot): The bot used for sending the messages.
+          - per_chat_interval (float, optional): Minimal number of seconds between two messages to the same chat
+            (default=1.0, Telegram allows about one message per second in a chat).
+          - global_rate (int, optional): Maximal number of messages sent per second (default=30).
+          - max_retries (int, optional): How many times a message rejected with HTTP 429 is sent again (default=5).
+          """
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.global_rate = global_rate
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        # messages waiting for their chat (key - unique ID of the chat, value - [text, number of attempts] in order)
+        self._pending = {}
+        # chats with pending messages ordered by the time their next message may be sent (time, order, chat ID)
+        self._ready = []
+        self._order = itertools.count()
+        self._last_sent = {}
+        self._tokens = float(global_rate)
+        self._refilled_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def send(self, chat_id, text):
+        """
+          Queue a text message for sending to a specified chat.
+
+          Parameters:
+          - chat_id (int or str): The unique identifier of the chat to which the message will be sent.
+          - text (str): The text content of the message.
+
+          Returns immediately, the message is sent by the sender thread as soon as the rate limits allow it.
+          """
+        self._queue.put((chat_id, text))
+
+    def start(self):
+        """
+          Start the sender thread.
+          """
+        self._thread.start()
+
+    def stop(self):
+        """
+          Send the messages queued so far and stop the sender thread.
+          """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+          Send the queued messages until `stop` is called and all of them are sent.
+
+          While no chat may receive its next message, the thread waits for new messages, so they are taken into
+          account right away (a message to an idle chat is sent before the messages to a chat cooling down).
+          """
+        stopping = False
+        while not stopping or self._ready:
+            delay = self._ready[0][0] - time.monotonic() if self._ready else None
+            if delay is not None and delay <= 0:
+                self._deliver(heapq.heappop(self._ready)[2])
+            elif stopping:
+                time.sleep(delay)
+            else:
+                try:
+                    item = self._queue.get(timeout=delay)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    stopping = True
+                else:
+                    self._add_pending(*item)
+
+    def _schedule(self, chat_id, ready_at):
+        """
+          Remember, when the next pending message may be sent to a chat.
+
+          Parameters:
+          - chat_id (int or str): The unique identifier of the chat.
+          - ready_at (float): The time (of `time.monotonic`) of the next message to the chat.
+          """
+        heapq.heappush(self._ready, (ready_at, next(self._order), chat_id))
+
+    def _add_pending(self, chat_id, text):
+        """
+          Put a queued message after the other messages waiting for the same chat.
+
+          Parameters:
+          - chat_id (int or str): The unique identifier of the chat to which the message will be sent.
+          - text (str): The text content of the message.
+          """
+        if chat_id in self._pending:
+            self._pending[chat_id].append([text, 0])
+            return
+        self._pending[chat_id] = collections.deque([[text, 0]])
+        last_sent = self._last_sent.get(chat_id)
+        self._schedule(chat_id, time.monotonic() if last_sent is None else last_sent + self.per_chat_interval)
+
+    def _deliver(self, chat_id):
+        """
+          Send the first pending message to a chat.
+
+          Parameters:
+          - chat_id (int or str): The unique identifier of the chat to which the message will be sent.
+
+          A message rejected with HTTP 429 stays first and the chat is deferred by the delay requested by Telegram,
+          other chats are not delayed by it. Otherwise the chat is deferred by `per_chat_interval`,
+          if it has more pending messages.
+          """
+        pending = self._pending[chat_id]
+        message = pending[0]
+        text, attempt = message
+        self._wait_for_token()
+        try:
+            self.bot.send_message(chat_id, text)
+        except ApiTelegramException as error:
+            if error.error_code == 429 and attempt < self.max_retries:
+                message[1] += 1
+                # Back off for the time requested by Telegram (or exponentially if it is not provided)
+                retry_after = error.result_json.get('parameters', {}).get('retry_after', 2 ** attempt)
+                self._schedule(chat_id, time.monotonic() + retry_after)
+                return
+            print(f"Error: Unable to send message to chat {chat_id}: {error.description}")
+        except Exception as error:
+            print(f"Error: Unable to send message to chat {chat_id}: {error}")
+
+        self._last_sent[chat_id] = time.monotonic()
+        pending.popleft()
+        if pending:
+            self._schedule(chat_id, self._last_sent[chat_id] + self.per_chat_interval)
+        else:
+            del self._pending[chat_id]
+
+    def _wait_for_token(self):
+        """
+          Sleep until a message may be sent without exceeding the global rate limit.
+
+          The global limit is a token bucket refilled with `global_rate` tokens per second.
+          """
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.global_rate, self._tokens + (now - self._refilled_at) * self.global_rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                break
+            time.sleep((1 - self._tokens) / self.global_rate)
+
+        self._tokens -= 1
@@ -0,0 +1,67 @@
+"""
+Module for formatting rows of the database as plain text tables sent by the bot.
+
+This module defines functions, which join the values of the rows with ' | ' and split long tables into several
+messages, because Telegram rejects messages longer than 4096 characters.
+"""
+
+# Separator of the values in a row of the table
+_SEPARATOR = ' | '
+
+# Maximal length of a text message accepted by Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+def format_row(values):
+    """
+      Format a single row of a table.
+
+      Parameters:
+      - values (iterable): The values of the row.
+
+      Returns:
+      - str: The values converted to strings and joined by ' | '.
+      """
+    return _SEPARATOR.join(map(str, values))
+
+
+def format_table(headers, rows):
+    """
+      Format rows as a plain text table.
+
+      Parameters:
+      - headers (iterable): The names of the columns.
+      - rows (iterable): The rows of the table.
+
+      Returns:
+      - str: The header line followed by one line per row.
+      """
+    return '\n'.join([format_row(headers), *map(format_row, rows)])
+
+
+def paginate_table(headers, rows, rows_per_page=50, max_length=MAX_MESSAGE_LENGTH):
+    """
+      Split rows into plain text tables, each of which fits into one Telegram message.
+
+      Parameters:
+      - headers (iterable): The names of the columns, repeated at the top of every page.
+      - rows (iterable): The rows of the table.
+      - rows_per_page (int, optional): Maximal number of rows on one page (default=50).
+      - max_length (int, optional): Maximal length of one page in characters (default=4096).
+
+      Yields:
+      - str: The formatted pages.
+
+      A single row longer than `max_length` is cut, so every page can be sent.
+      """
+    header = format_row(headers)
+    lines, length = [], len(header)
+    for row in rows:
+        line = format_row(row)[:max_length - len(header) - 1]
+        if len(lines) == rows_per_page or length + 1 + len(line) > max_length:
+            yield '\n'.join([header, *lines])
+            lines, length = [], len(header)
+        lines.append(line)
+        length += 1 + len(line)
+    if lines:
+        yield '\n'.join([header, *lines])
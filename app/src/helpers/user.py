@@ -4,6 +4,45 @@ Module for managing and interacting with user information in the 'users' table.
 This module defines the User class, which represents a user entity. It includes methods for initializing
 a user instance, creating a new user in the database, and retrieving user information from the database.
 """
+import csv
+import hashlib
+import hmac
+import io
+import secrets
+import sys
+from collections import namedtuple
+from itertools import islice
+
+from psycopg2.extras import execute_values
+
+from .db import db
+
+# All statements are built once at import time (psycopg2 uses the 'format' parameter style)
+_PLACEHOLDER = '%s'
+_COLUMNS = ('login', 'password', 'isAdmin')
+_COLUMN_LIST = ', '.join(_COLUMNS)
+_VALUES = ', '.join([_PLACEHOLDER] * len(_COLUMNS))
+
+_INSERT_USER_SQL = sys.intern(f'INSERT INTO users ({_COLUMN_LIST}) VALUES ({_VALUES}) RETURNING id;')
+_BULK_INSERT_USER_SQL = sys.intern(f'INSERT INTO users ({_COLUMN_LIST}) VALUES {_PLACEHOLDER};')
+_COPY_USERS_SQL = sys.intern(f'COPY users ({_COLUMN_LIST}) FROM STDIN WITH (FORMAT CSV);')
+_UPDATE_USERS_SQL = sys.intern(
+    f'UPDATE users SET {", ".join(f"{column} = v.{column}" for column in _COLUMNS)} '
+    f'FROM (VALUES {_PLACEHOLDER}) AS v (id, {_COLUMN_LIST}) WHERE users.id = v.id;'
+)
+_UPDATE_USERS_TEMPLATE = f'({_PLACEHOLDER}::integer, {_PLACEHOLDER}, {_PLACEHOLDER}, {_PLACEHOLDER}::boolean)'
+_DELETE_USERS_SQL = sys.intern(f'DELETE FROM users WHERE id = ANY({_PLACEHOLDER});')
+_SELECT_USERS_SQL = sys.intern(f'SELECT id, {_COLUMN_LIST} FROM users;')
+
+# Read-only view of a row of the 'users' table
+UserRow = namedtuple('UserRow', 'user_id login password is_admin')
+
+# Values of a user, who has not been filled in yet
+_EMPTY_USER = (None,) * 4
+
+# Passwords are stored as 'scrypt$<salt>$<hash>' (both hex encoded)
+_PASSWORD_SCHEME = 'scrypt'
+_SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1}
 
 
 class User:
@@ -13,13 +52,26 @@ class User:
     Attributes:
     - user_id (int): The unique identifier for the user.
     - login (str): The login associated with the user.
-    - password (str): The password associated with the user.
+    - password (str): The salted hash of the password associated with the user (see `hash_password`).
     - is_admin (bool): A boolean indicating whether the user has administrative privileges.
 
     Methods:
     - __init__(self, user=None): Initializes an instance of the User class.
-    - create_new_user(self, cursor, connection): Creates a new user in the database.
+    - hash_password(password): Hashes a password for storing in the database.
+    - check_password(self, password): Checks whether the password matches the stored one.
+    - needs_rehash(self): Checks whether the stored password is not hashed yet.
+    - empty(cls): Creates an instance of the User class with all attributes set to None.
+    - from_row(cls, row): Creates an instance of the User class from a database row.
+    - create_new_user(self, cursor=None, connection=None, commit=True): Creates a new user in the database.
+    - bulk_insert(cls, cursor, connection, users, batch_size=1000): Inserts many users in batches.
+    - copy_insert(cls, connection, users): Loads many users using the COPY command.
+    - update_many(cls, cursor, connection, users): Updates many users with a single statement.
+    - delete_many(cls, cursor, connection, ids): Deletes many users with a single statement.
+    - rows(cls, cursor): Retrieves all users from the database as read-only rows.
+    - iter_rows(cls, cursor): Lazily iterates over all users as read-only rows.
     """
+    __slots__ = ('user_id', 'login', 'password', 'is_admin')
+
     def __init__(self, user=None):
         """
           Initialize an instance of the User class.
@@ -28,28 +80,207 @@ class User:
           - user (tuple, optional): A tuple containing user information retrieved from the database (default=None).
 
           If `user` is provided, the instance is initialized with the values from the tuple.
-          Otherwise, the instance is created with attributes set to None.
+          Otherwise, the attributes are left unset and must be assigned before they are read
+          (use `empty` to get an instance with all attributes set to None).
           """
         if user:
-            self.user_id = user[0]
-            self.login = user[1]
-            self.password = user[2]
-            self.is_admin = user[3]
-        else:
-            self.user_id = None
-            self.login = None
-            self.password = None
-            self.is_admin = None
-
-    def create_new_user(self, cursor, connection):
+            self.user_id, self.login, self.password, self.is_admin = user
+
+    @staticmethod
+    def hash_password(password):
+        """
+          Hash a password for storing in the database.
+
+          Parameters:
+          - password (str): The password in plain text.
+
+          Returns:
+          - str: The password hashed by scrypt with a random salt (formatted as 'scrypt$<salt>$<hash>').
+          """
+        salt = secrets.token_bytes(16)
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, **_SCRYPT_PARAMS)
+        return f'{_PASSWORD_SCHEME}${salt.hex()}${digest.hex()}'
+
+    def check_password(self, password):
+        """
+          Check whether the given password matches the password of the user.
+
+          Parameters:
+          - password (str): The password in plain text.
+
+          Returns:
+          - bool: True if the password is correct, False otherwise.
+
+          The comparison takes the same time no matter where the passwords differ. Passwords saved in plain text
+          before hashing was introduced are still accepted (see `needs_rehash`). A malformed hash matches
+          no password.
+          """
+        if self.password is None:
+            return False
+
+        if self.needs_rehash():
+            return hmac.compare_digest(self.password.encode('utf-8'), password.encode('utf-8'))
+
+        salt, _, digest = self.password.removeprefix(f'{_PASSWORD_SCHEME}$').partition('$')
+        try:
+            candidate = hashlib.scrypt(password.encode('utf-8'), salt=bytes.fromhex(salt), **_SCRYPT_PARAMS)
+            return hmac.compare_digest(candidate, bytes.fromhex(digest))
+        except ValueError:
+            return False
+
+    def needs_rehash(self):
+        """
+          Check whether the password of the user is stored in plain text (saved before hashing was introduced).
+
+          Returns:
+          - bool: True if the password should be replaced by its hash (see `hash_password`), False otherwise.
+          """
+        return self.password is not None and self.password.partition('$')[0] != _PASSWORD_SCHEME
+
+    @classmethod
+    def empty(cls):
+        """
+          Create an instance of the User class with all attributes set to None.
+
+          Returns:
+          - User: The empty user.
+          """
+        return cls(_EMPTY_USER)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+          Create an instance of the User class from a row of the 'users' table.
+
+          Parameters:
+          - row (tuple): A tuple containing user information retrieved from the database.
+
+          Returns:
+          - User: The user filled in with the values from the row.
+          """
+        return cls(row)
+
+    def create_new_user(self, cursor=None, connection=None, commit=True):
         """
           Creates a new user in the 'users' table of the database.
 
+          Parameters:
+          - cursor (optional): Database cursor object (default=one on a connection borrowed from the pool,
+            see `helpers.db.db`).
+          - connection (optional): Database connection object (default=one borrowed from the pool).
+          - commit (bool, optional): Whether to commit the changes right away (default=True).
+
+          Returns:
+          - int: The unique identifier assigned to the user by the database, which is also stored in `user_id`.
+          """
+        if cursor is None or connection is None:
+            # the insert is committed at the end of the block
+            with db() as (connection, cursor):
+                return self.create_new_user(cursor, connection, commit=False)
+        cursor.execute(_INSERT_USER_SQL, (self.login, self.password, self.is_admin))
+        self.user_id = cursor.fetchone()[0]
+        if commit:
+            connection.commit()
+        return self.user_id
+
+    @classmethod
+    def bulk_insert(cls, cursor, connection, users, batch_size=1000):
+        """
+          Insert many users into the database using a single multi-row INSERT per batch.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - connection: Database connection object.
+          - users (iterable): Instances of the User class to be inserted.
+          - batch_size (int, optional): Maximum number of rows sent in one INSERT (default=1000).
+
+          The changes are committed once per batch instead of once per user.
+          """
+        users = iter(users)
+        while batch := list(islice(users, batch_size)):
+            rows = [(user.login, user.password, user.is_admin) for user in batch]
+            execute_values(cursor, _BULK_INSERT_USER_SQL, rows, page_size=batch_size)
+            connection.commit()
+
+    @classmethod
+    def copy_insert(cls, connection, users):
+        """
+          Load many users into the database through the COPY command of PostgreSQL.
+
+          Parameters:
+          - connection: Database connection object.
+          - users (iterable): Instances of the User class to be inserted.
+
+          The users are written into an in-memory CSV buffer, which is streamed to the server in one command.
+          Commits the changes to the database.
+          """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows((user.login, user.password, user.is_admin) for user in users)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(_COPY_USERS_SQL, buffer)
+        connection.commit()
+
+    @classmethod
+    def update_many(cls, cursor, connection, users):
+        """
+          Update many users in the database using a single UPDATE statement.
+
           Parameters:
           - cursor: Database cursor object.
           - connection: Database connection object.
+          - users (iterable): Instances of the User class with `user_id` set, holding the new values.
+
+          Commits the changes to the database.
           """
-        cursor.execute(f'''
-            INSERT INTO users (login, password, isAdmin) VALUES ('{self.login}', '{self.password}', {self.is_admin});
-        ''')
+        rows = [(user.user_id, user.login, user.password, user.is_admin) for user in users]
+        execute_values(cursor, _UPDATE_USERS_SQL, rows, template=_UPDATE_USERS_TEMPLATE, page_size=len(rows) or 1)
         connection.commit()
+
+    @classmethod
+    def delete_many(cls, cursor, connection, ids):
+        """
+          Delete many users from the database using a single DELETE statement.
+
+          Parameters:
+          - cursor: Database cursor object.
+          - connection: Database connection object.
+          - ids (iterable): Unique identifiers of the users to be deleted.
+
+          Returns:
+          - int: The number of deleted users.
+
+          Commits the changes to the database.
+          """
+        cursor.execute(_DELETE_USERS_SQL, (list(ids),))
+        connection.commit()
+        return cursor.rowcount
+
+    @classmethod
+    def rows(cls, cursor):
+        """
+          Retrieve all users from the 'users' table.
+
+          Parameters:
+          - cursor: Database cursor object.
+
+          Returns:
+          - list: UserRow named tuples, one per user.
+
+          Meant for code which only reads the users, so no User instances are created.
+          """
+        return list(cls.iter_rows(cursor))
+
+    @classmethod
+    def iter_rows(cls, cursor):
+        """
+          Lazily iterate over all users from the 'users' table.
+
+          Parameters:
+          - cursor: Database cursor object.
+
+          Yields:
+          - UserRow: Named tuple for each user, created only when it is reached.
+          """
+        cursor.execute(_SELECT_USERS_SQL)
+        yield from map(UserRow._make, cursor)
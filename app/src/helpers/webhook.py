@@ -0,0 +1,72 @@
+"""
+Module for receiving updates from Telegram through a webhook.
+
+This module defines the WebhookServer class, a small HTTP server which receives the updates pushed by Telegram
+and passes them to the bot, so the bot does not have to keep polling Telegram while nobody writes to it.
+"""
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    Represents an HTTP server, which passes the updates posted by Telegram to the bot.
+
+    Attributes:
+    - bot (telebot.TeleBot): The bot processing the received updates.
+    - webhook_path (str): The secret path, to which Telegram posts the updates (e.g. '/<token>').
+    - secret_token (str): The token sent by Telegram in the 'X-Telegram-Bot-Api-Secret-Token' header.
+
+    Methods:
+    - __init__(self, bot, host, port, webhook_path, secret_token): Initializes the server and binds it
+      to the given address.
+    - serve_forever(self): Handles the incoming requests until the server is shut down (inherited).
+    """
+    def __init__(self, bot, host, port, webhook_path, secret_token):
+        """
+          Initialize an instance of the WebhookServer class.
+
+          Parameters:
+          - bot (telebot.TeleBot): The bot processing the received updates.
+          - host (str): The address the server listens on.
+          - port (int): The port the server listens on.
+          - webhook_path (str): The secret path, to which Telegram posts the updates.
+          - secret_token (str): The token passed to `bot.set_webhook`, which Telegram sends with every update.
+          """
+        self.bot = bot
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        super().__init__((host, port), _WebhookHandler)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Handles a single request posted to the WebhookServer.
+    """
+    def do_POST(self):
+        """
+          Pass the posted update to the bot, if it was sent to the secret path of the server with the secret token.
+          """
+        if self.path != self.server.webhook_path:
+            self.send_error(404)
+            return
+
+        # the token is compared in constant time, so it cannot be guessed from the time of the response
+        secret_token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(secret_token.encode('utf-8'), self.server.secret_token.encode('utf-8')):
+            self.send_error(403)
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.bot.process_new_updates([types.Update.de_json(body.decode('utf-8'))])
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """
+          Do not log every received update.
+          """
@@ -13,77 +13,99 @@ python main.py <config_file>
 
 Author: Aleksei Grachev
 """
+import secrets
 import signal
 import sys
 import threading
-import time
-import json
 
 import schedule
-import psycopg2
 import telebot
-from tabulate import tabulate
+from psycopg2.errors import UniqueViolation
 from telebot import types
 
 from helpers.advert import Add
+from helpers.config import Config, load_config
+from helpers.db import close_pool, db, execute_prepared, init_pool
+from helpers.sender import RateLimitedSender
+from helpers.table import paginate_table
+from helpers.webhook import WebhookServer
 from helpers.user import User
 
 
-def load_config(path):
-    """
-        Load configuration data from a JSON file.
-
-        Parameters:
-        - path (str): The path to the JSON configuration file.
+# Configuration of the server, the bot, the sender of adds and the schedule thread (all set up by `main`)
+config: Config = None
+bot: telebot.TeleBot = None
+sender: RateLimitedSender = None
+schedule_thread: threading.Thread = None
 
-        Returns:
-        - dict: A dictionary containing the configuration data.
+# Hot lookups, which are prepared once per database session (name, statement)
+LOGIN_LOOKUP = ('login_lookup', 'SELECT id, password, isAdmin FROM users WHERE login = $1')
 
-        Raises:
-        - FileNotFoundError: If the specified configuration file is not found.
-        - json.JSONDecodeError: If there is an issue parsing the JSON data.
 
-        The function attempts to open and read the specified JSON file at the given path.
-        If successful, it parses the JSON content and returns the configuration data as a dictionary.
-        """
-    try:
-        with open(path, encoding='utf-8') as config_file:
-            config_data = json.load(config_file)
-        return config_data
-    except FileNotFoundError:
-        print(f"Error: Configuration file '{path}' not found.")
-        sys.exit(1)
-    except json.JSONDecodeError:
-        print(f"Error: Unable to parse JSON in '{path}'.")
-        sys.exit(1)
+def build_keyboard(*buttons):
+    """
+     Build an inline keyboard with one button per row.
 
+     Parameters:
+     - buttons (tuple): Pairs (text, callback data) of the buttons.
 
-if len(sys.argv) != 2:
-    print("Usage: python main.py <config_file>")
-    sys.exit(1)
+     Returns:
+     - str: The keyboard serialized to JSON, which telebot sends to Telegram as it is.
+     """
+    keyboard = types.InlineKeyboardMarkup()
+    for text, callback_data in buttons:
+        keyboard.add(types.InlineKeyboardButton(text, callback_data=callback_data))
+    return keyboard.to_json()
 
-# getting configuration from the inputted as CLI parameter json file
-config_path = sys.argv[1]
-config = load_config(config_path)
 
-# Initialize the bot
-bot = telebot.TeleBot(config.get('token'))
+# Menus, which never change, so they are built and serialized only once
+ADMIN_KEYBOARD = build_keyboard(('Display all registered users', 'display_users'),
+                                ('Create new user', 'new_user'),
+                                ('Exit', 'exit'))
+USER_KEYBOARD = build_keyboard(('Display previous adds', 'display_adds'),
+                               ('Create new add', 'new_add'),
+                               ('Exit', 'exit'))
+DELETE_ADD_KEYBOARD = build_keyboard(('Delete', 'delete_add'), ('Back', 'back_user'))
+DELETE_USER_KEYBOARD = build_keyboard(('Delete', 'delete_user'), ('Back', 'back_admin'))
 
-# Establish a connection to the database
-connection = psycopg2.connect(**config.get('db_config'))
+# Callbacks of the admin keyboards, which are handled only for a logged admin
+ADMIN_CALLBACKS = frozenset({'display_users', 'new_user', 'delete_user', 'back_admin'})
 
-# Create a cursor object to execute SQL queries
-cursor = connection.cursor()
+# Logged users (key - unique ID of the chat, value - user logged in that chat)
+sessions: dict = {}
 
-# Current logged user (empty in the beginning)
-current_user: User = User()
+# Next steps of the conversations (key - unique ID of the chat, value - (step function, its extra arguments))
+conversation_steps = {}
 
 # dictionary for storing schedules (key - unique ID of add, value - link to schedule)
 schedule_jobs = {}
 
+# lock guarding `schedule_jobs`, which is changed from the handler threads
+jobs_lock = threading.Lock()
+
 # indicator of running for thread, which is responsible for sending adds
 running_flag = True
 
+# longest time (in seconds) the schedule thread sleeps without checking the wall clock
+MAX_SCHEDULER_SLEEP = 60
+
+# event for waking the schedule thread up before its next job is due (new job was added or server stops)
+scheduler_wakeup = threading.Event()
+
+
+def set_next_step(message, step, *args):
+    """
+     Set the function, which processes the next message sent to the chat.
+
+     Parameters:
+     - message (telegram.Message): A message from the chat.
+     - step (function): The function called as `step(message, *args)` with the next message.
+     - args (tuple): Extra arguments of the step (e.g. the add being created).
+
+     The step replaces any step set for the chat before. The next message is passed to it by `process_next_step`.
+     """
+    conversation_steps[message.chat.id] = (step, args)
+
 
 # Function to send a text to the specified chat ID
 def send_message(chat_id, text):
@@ -94,10 +116,12 @@ def send_message(chat_id, text):
      - chat_id (int or str): The unique identifier of the chat to which the message will be sent.
      - text (str): The text content of the message.
 
-     Sends a text message to the specified chat using the provided bot. The `chat_id` parameter
-     uniquely identifies the target chat, and the `text` parameter contains the content of the message.
+     Queues a text message for the specified chat. The message is sent by the `sender` thread, which keeps
+     the bot within the rate limits of Telegram, so many adds scheduled for the same moment do not get rejected.
+     The `chat_id` parameter uniquely identifies the target chat, and the `text` parameter contains the content
+     of the message.
      """
-    bot.send_message(chat_id, text)
+    sender.send(chat_id, text)
 
 
 # Start the scheduler in a separate thread
@@ -106,48 +130,113 @@ def schedule_thread_func():
      Continuously run the scheduled tasks as long as the running flag is True.
 
      This function is designed to be executed in a separate thread. It utilizes the `schedule`
-     library to run pending scheduled tasks while the `running_flag` is True. The function
-     sleeps for 2 seconds between iterations to avoid excessive resource consumption.
+     library to run pending scheduled tasks while the `running_flag` is True. Between iterations
+     the function sleeps until the next job is due, but at most `MAX_SCHEDULER_SLEEP` seconds (or until
+     `scheduler_wakeup` is set, when a new job is added or the server stops). `schedule` computes the due time
+     from the wall clock, while the wait counts down on the monotonic clock, so the wall clock is read again
+     at least once a minute and a DST change, a clock step or a suspend of the host delays no job for long.
      """
     while running_flag:
         schedule.run_pending()
-        time.sleep(2)
+        timeout = schedule.idle_seconds()
+        scheduler_wakeup.wait(None if timeout is None else min(timeout, MAX_SCHEDULER_SLEEP))
+        scheduler_wakeup.clear()
+
+
+def schedule_add(add_id, chat_id, text, interval, at_time):
+    """
+     Register the job, which sends an add according to its interval.
+
+     Parameters:
+     - add_id (int): The unique identifier of the add, used as a key in `schedule_jobs`.
+     - chat_id (int or str): The unique identifier of the chat to which the add will be sent.
+     - text (str): The text content of the add.
+     - interval (str): The interval at which the add should be sent ('day', 'hour' or 'minute').
+     - at_time (str): The time at which the add should be sent within the interval ('hh:mm', ':mm' or ':ss').
+
+     Returns:
+     - schedule.Job: The registered job.
+
+     Wakes the schedule thread up, so the new job is taken into account right away.
+     """
+    # schedule.every().day / .hour / .minute
+    with jobs_lock:
+        job = getattr(schedule.every(), interval).at(at_time).do(send_message, chat_id, text)
+        schedule_jobs[add_id] = job
+    scheduler_wakeup.set()
+    return job
+
+
+# Slots, among which the adds without a pinned time are spread
+# (interval: (unit of the job, field of its time, allowed slots, time format)),
+# daily adds are sent only during the day (9:00 - 20:00), not at night
+SPREAD_SLOTS = {
+    'minute': ('minutes', 'second', range(60), ':{:02d}'),
+    'hour': ('hours', 'minute', range(60), ':{:02d}'),
+    'day': ('days', 'hour', range(9, 21), '{:02d}:00'),
+}
+
+
+def spread_time(interval):
+    """
+     Choose the time for an add, which may be sent at any time within its interval.
+
+     Parameters:
+     - interval (str): The interval at which the add should be sent ('day', 'hour' or 'minute').
+
+     Returns:
+     - str: The time of the least used slot (the second of a minute, the minute of an hour or the hour of a day).
+
+     Adds are spread evenly over the allowed slots of the interval (see `SPREAD_SLOTS`), so they do not all fire
+     in the same second and the sender does not have to queue bursts of messages to stay within the rate limits
+     of Telegram. Only jobs with the same unit are counted, and if several slots are used equally, the earliest
+     of them is chosen.
+     """
+    unit, field, slots, time_format = SPREAD_SLOTS[interval]
+    load = dict.fromkeys(slots, 0)
+    with jobs_lock:
+        for job in schedule.get_jobs():
+            if job.unit == unit and job.at_time is not None:
+                slot = getattr(job.at_time, field)
+                if slot in load:
+                    load[slot] += 1
+    return time_format.format(min(slots, key=lambda slot: (load[slot], slot)))
 
 
-# Create a thread for the schedule
-schedule_thread = threading.Thread(target=schedule_thread_func)
+def unschedule_add(add_id):
+    """
+     Cancel the job, which sends an add, and forget it.
 
-# Start the thread
-schedule_thread.start()
+     Parameters:
+     - add_id (int): The unique identifier of the add, used as a key in `schedule_jobs`.
 
-# Create a table to store users if it does not exist
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-    id SERIAL PRIMARY KEY,
-    login VARCHAR(255) NOT NULL,
-    password VARCHAR(255) NOT NULL,
-    isAdmin BOOLEAN
-    );
-''')
+     Does nothing if no job is registered for the add.
+     """
+    with jobs_lock:
+        job = schedule_jobs.pop(add_id, None)
+        if job:
+            schedule.cancel_job(job)
 
-# Create a table to store adds if it does not exist
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS adds (
-    id SERIAL PRIMARY KEY,
-    login VARCHAR(255) NOT NULL,
-    chat_id BIGINT NOT NULL,
-    text TEXT NOT NULL,
-    interval TEXT NOT NULL,
-    time TEXT NOT NULL
-    );
-''')
 
-# Commit all changes into database
-connection.commit()
+def load_scheduled_adds():
+    """
+     Schedule all adds saved in the database, so they keep being sent after the server restarts.
+
+     The adds are read with a single query through a server-side cursor, which streams them in chunks
+     of 1000 rows instead of loading the whole table into memory at once. Adds with a time, which cannot be
+     scheduled, are skipped.
+     """
+    with db() as (connection, cursor):
+        with connection.cursor(name='load_adds') as adds_cursor:
+            adds_cursor.itersize = 1000
+            for add in Add.iter_rows(adds_cursor):
+                try:
+                    schedule_add(add.id, add.chat_id, add.text, add.interval, add.time)
+                except schedule.ScheduleValueError as e:
+                    print(f"Error: Unable to schedule add with id - {add.id}: {e}")
 
 
 # Command to start the log in process
-@bot.message_handler(commands=['start'])
 def start(message):
     """
     Handle the /start command, initiating the conversation.
@@ -157,13 +246,12 @@ def start(message):
 
     Initiates the conversation when the user sends the /start command. Sends a welcome message
     to the user and prompts them to provide their login. The conversation is then directed to
-    the `process_login_step` function using `bot.register_next_step_handler`.
+    the `process_login_step` function using `set_next_step`.
     """
     bot.send_message(message.chat.id, "Hello, to start please write your login:")
-    bot.register_next_step_handler(message, process_login_step)
+    set_next_step(message, process_login_step)
 
 
-@bot.message_handler(commands=['exit'])
 def log_out(message):
     """
     Handle the /exit command, logging the user out.
@@ -171,13 +259,14 @@ def log_out(message):
     Parameters:
     - message (telegram.Message): The message object representing the /exit command.
 
-    The user is informed that they have been logged out
+    Forgets the user logged in the chat and the step of its conversation. The user is informed that they have been logged out
     and can log in again by sending the /start command.
     """
+    sessions.pop(message.chat.id, None)
+    conversation_steps.pop(message.chat.id, None)
     bot.send_message(message.chat.id, "You have logged out. Write /start if you want to log in.")
 
 
-@bot.callback_query_handler(func=lambda call: True)
 def handle_callback_query(call):
     """
      Handle callback queries triggered by inline keyboards.
@@ -187,49 +276,63 @@ def handle_callback_query(call):
 
      Responds to different callback data by initiating various actions such as creating a new user,
      adding a new post, displaying users or posts, deleting posts or users, and navigating back or exiting.
+     Except for exiting, the actions are available only in a chat with a logged user (see `sessions`),
+     and the actions of the admin keyboards (`ADMIN_CALLBACKS`) only to an admin, because keyboards sent
+     before the user logged out can still be pressed.
      """
+    current_user = sessions.get(call.message.chat.id)
+    if call.data == 'exit':
+        log_out(call.message)
+        return
+    if current_user is None:
+        bot.send_message(call.message.chat.id, "You are not logged in. Write /start to log in.")
+        return
+    if call.data in ADMIN_CALLBACKS and not current_user.is_admin:
+        bot.send_message(call.message.chat.id, "Only an admin can do that.")
+        return
+
     if call.data == 'new_user':
         new_user: User = User()
         # Login
         bot.send_message(call.message.chat.id, 'Write login of new user:')
-        bot.register_next_step_handler(call.message, process_new_login, new_user)
+        set_next_step(call.message, process_new_login, new_user)
     elif call.data == 'new_add':
         new_add: Add = Add()
         new_add.login = current_user.login
         bot.send_message(call.message.chat.id, 'Write chatID of the chat, where you want to post your add:')
-        bot.register_next_step_handler(call.message, process_new_chat_id, new_add)
+        set_next_step(call.message, process_new_chat_id, new_add)
     elif call.data == 'display_users':
-        cursor.execute('SELECT * FROM users')
-        adds_data = cursor.fetchall()
+        with db(read_only=True) as (connection, cursor):
+            cursor.execute('SELECT id, login, isAdmin FROM users')
+            adds_data = cursor.fetchall()
 
-        table = tabulate(adds_data, headers=['ID', 'Login', 'Password', 'isAdmin'],
-                         tablefmt='pretty')
-        bot.send_message(call.message.chat.id, table)
+        # Long lists are split into several messages (at most 50 rows and 4096 characters each)
+        for table in paginate_table(['ID', 'Login', 'isAdmin'], adds_data):
+            bot.send_message(call.message.chat.id, table)
         delete_user_buttons(call.message)
     elif call.data == 'display_adds':
-        cursor.execute(f"SELECT * FROM adds WHERE login = '{current_user.login}'")
-        adds_data = cursor.fetchall()
+        with db(read_only=True) as (connection, cursor):
+            cursor.execute('SELECT id, login, chat_id, "text", "interval", "time" FROM adds WHERE login = %s',
+                           (current_user.login,))
+            adds_data = cursor.fetchall()
 
         if adds_data:
-            table = tabulate(adds_data, headers=['ID', 'Login', 'Chat ID', 'Text', 'Interval', 'Time'],
-                             tablefmt='pretty')
-            bot.send_message(call.message.chat.id, table)
+            for table in paginate_table(['ID', 'Login', 'Chat ID', 'Text', 'Interval', 'Time'], adds_data):
+                bot.send_message(call.message.chat.id, table)
             delete_add_buttons(call.message)
         else:
             bot.send_message(call.message.chat.id, "No previously saved adds were found.")
             user(call.message)
     elif call.data == 'delete_add':
         bot.send_message(call.message.chat.id, "Write ID of the add, which you want to be deleted.")
-        bot.register_next_step_handler(call.message, delete_add)
+        set_next_step(call.message, delete_add)
     elif call.data == 'delete_user':
         bot.send_message(call.message.chat.id, "Write ID of the user, which you want to be deleted.")
-        bot.register_next_step_handler(call.message, delete_user)
+        set_next_step(call.message, delete_user)
     elif call.data == 'back_user':
         user(call.message)
     elif call.data == 'back_admin':
         admin(call.message)
-    elif call.data == 'exit':
-        log_out(call.message)
 
 
 # Process login step
@@ -242,51 +345,62 @@ def process_login_step(message):
 
       Takes the user's input as their login, checks if the user exists in the database, and proceeds
       to the next step in the login process. If the user exists, prompts the user to enter their password
-      and registers the next step with `process_password_step`. If the user does not exist, informs the
+      and registers the next step with `process_password_step`, which gets the found user (the user is not
+      logged in until the password is checked). If the user does not exist, informs the
       user and prompts them to try again, registering the next step with `process_login_step`.
       """
     login = message.text
 
     # find the user
-    cursor.execute(f"SELECT * FROM users WHERE login = '{login}'")
-    existing_user = cursor.fetchone()
-    global current_user
-    current_user = User(existing_user)
+    with db(read_only=True) as (connection, cursor):
+        execute_prepared(cursor, *LOGIN_LOOKUP, (login,))
+        existing_user = cursor.fetchone()
 
-    # Check if the user exists
+    # Check if the user exists (the user is created only if it does)
     if existing_user:
+        user_id, password, is_admin = existing_user
+        found_user = User((user_id, login, password, is_admin))
         bot.send_message(message.chat.id, "Great! Now, please enter your password:")
-        bot.register_next_step_handler(message, process_password_step)
+        set_next_step(message, process_password_step, found_user)
     else:
         bot.send_message(message.chat.id, "User with this login does not exist. Try again:")
-        bot.register_next_step_handler(message, process_login_step)
+        set_next_step(message, process_login_step)
 
 
 # Process password step
-def process_password_step(message):
+def process_password_step(message, found_user):
     """
     Process the user's password during the login step of the conversation.
 
     Parameters:
     - message (telegram.Message): The message object representing the user's input.
+    - found_user: An instance of the User class representing the user with the entered login.
 
     Takes the user's input as their password, checks if the provided password matches the stored
-    password for the current user, and directs the conversation to either admin or user mode.
+    password of the found user, and directs the conversation to either admin or user mode.
     If the password is incorrect, prompts the user to try again by registering the next step with
-    `process_password_step`. If the password is correct, welcomes the user to either admin or user
-    mode and calls the corresponding function (`admin` or `user`) to handle the next steps.
+    `process_password_step`. If the password is correct, replaces a password stored in plain text by its hash,
+    logs the user in the chat (see `sessions`), welcomes the user to either admin or user mode and calls
+    the corresponding function (`admin` or `user`) to handle the next steps.
     """
-    # global current_user
     password = message.text
 
     # if password is wrong
-    if password != current_user.password:
+    if not found_user.check_password(password):
         bot.send_message(message.chat.id, "Wrong password! Try again:")
-        bot.register_next_step_handler(message, process_password_step)
+        set_next_step(message, process_password_step, found_user)
         return
 
+    # passwords saved before hashing was introduced are hashed, once the user proves to know them
+    if found_user.needs_rehash():
+        found_user.password = User.hash_password(password)
+        with db() as (connection, cursor):
+            cursor.execute('UPDATE users SET password = %s WHERE id = %s', (found_user.password, found_user.user_id))
+
+    sessions[message.chat.id] = found_user
+
     # Admin mode or user one
-    if current_user.is_admin:
+    if found_user.is_admin:
         # admin mode
         bot.send_message(message.chat.id, "Welcome! You are in admin mode.")
         admin(message)
@@ -303,19 +417,10 @@ def admin(message):
     Parameters:
     - message (telegram.Message): The message object representing the user's interaction.
 
-    Creates an inline keyboard with options such as displaying all registered users, creating a new user,
-    and exiting the current operation. The keyboard is then sent to the user as a message.
+    Sends the user the inline keyboard (`ADMIN_KEYBOARD`) with options such as displaying all registered users,
+    creating a new user, and exiting the current operation.
     """
-    button_display = types.InlineKeyboardButton('Display all registered users', callback_data='display_users')
-    button_create = types.InlineKeyboardButton('Create new user', callback_data='new_user')
-    button_exit = types.InlineKeyboardButton('Exit', callback_data='exit')
-
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(button_display)
-    keyboard.add(button_create)
-    keyboard.add(button_exit)
-
-    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=keyboard)
+    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=ADMIN_KEYBOARD)
 
 
 def user(message):
@@ -325,19 +430,10 @@ def user(message):
     Parameters:
     - message (telegram.Message): The message object representing the user's interaction.
 
-    Creates an inline keyboard with options such as displaying previous adds, creating a new add,
-    and exiting the current operation. The keyboard is then sent to the user as a message.
+    Sends the user the inline keyboard (`USER_KEYBOARD`) with options such as displaying previous adds,
+    creating a new add, and exiting the current operation.
     """
-    button_display = types.InlineKeyboardButton('Display previous adds', callback_data='display_adds')
-    button_create = types.InlineKeyboardButton('Create new add', callback_data='new_add')
-    button_exit = types.InlineKeyboardButton('Exit', callback_data='exit')
-
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(button_display)
-    keyboard.add(button_create)
-    keyboard.add(button_exit)
-
-    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=keyboard)
+    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=USER_KEYBOARD)
 
 
 def delete_add(message):
@@ -347,22 +443,23 @@ def delete_add(message):
     Parameters:
     - message (telegram.Message): The message object representing the user's input.
 
-    Takes the user's input as the ID of the add to be deleted, checks if the add with the specified ID exists
-    in the database, and proceeds to delete it. If the add is successfully deleted, informs the user.
+    Takes the user's input as the ID of the add to be deleted and deletes the add with a single query, which
+    also tells whether the add existed. If the add is successfully deleted, cancels its job and informs the user.
     If the add with the specified ID is not found, prompts the user to try again.
     """
     id_to_delete = message.text
-    cursor.execute(f"SELECT * FROM adds WHERE id = {id_to_delete};")
-    adds_data = cursor.fetchall()
+    # Delete the row of the add from the table (the change is committed at the end of the block)
+    with db() as (connection, cursor):
+        cursor.execute('DELETE FROM adds WHERE id = %s RETURNING id;', (id_to_delete,))
+        deleted_add = cursor.fetchone()
 
-    if adds_data:
-        # Delete the row of the add from the table
-        cursor.execute(f"DELETE FROM adds WHERE id = {id_to_delete};")
+    if deleted_add:
+        unschedule_add(deleted_add[0])
         bot.send_message(message.chat.id, 'The add was successfully deleted.')
         user(message)
     else:
         bot.send_message(message.chat.id, f"Hmmm... There is no add with id - {id_to_delete}. Try again:")
-        bot.register_next_step_handler(message, delete_add)
+        set_next_step(message, delete_add)
 
 
 def delete_user(message):
@@ -372,22 +469,22 @@ def delete_user(message):
     Parameters:
     - message (telegram.Message): The message object representing the user's input.
 
-    Takes the user's input as the ID of the user to be deleted, checks if the user with the specified ID exists
-    in the database, and proceeds to delete it. If the user is successfully deleted, informs the admin.
+    Takes the user's input as the ID of the user to be deleted and deletes the user with a single query, which
+    also tells whether the user existed. If the user is successfully deleted, informs the admin.
     If the user with the specified ID is not found, prompts the admin to try again.
     """
     id_to_delete = message.text
-    cursor.execute(f"SELECT * FROM users WHERE id = {id_to_delete};")
-    users_data = cursor.fetchall()
+    # Delete the row of the user from the table (the change is committed at the end of the block)
+    with db() as (connection, cursor):
+        cursor.execute('DELETE FROM users WHERE id = %s RETURNING id;', (id_to_delete,))
+        deleted_user = cursor.fetchone()
 
-    if users_data:
-        # Delete the row of the add from the table
-        cursor.execute(f"DELETE FROM users WHERE id = {id_to_delete};")
+    if deleted_user:
         bot.send_message(message.chat.id, 'The user was successfully deleted.')
         admin(message)
     else:
         bot.send_message(message.chat.id, f"Hmmm... There is no user with id - {id_to_delete}. Try again:")
-        bot.register_next_step_handler(message, delete_user)
+        set_next_step(message, delete_user)
 
 
 def delete_add_buttons(message):
@@ -397,17 +494,10 @@ def delete_add_buttons(message):
      Parameters:
      - message (telegram.Message): The message object representing the user's interaction.
 
-     Creates an inline keyboard with options such as deleting the current add or going back to the
-     user menu. The keyboard is then sent to the user as a message.
+     Sends the user the inline keyboard (`DELETE_ADD_KEYBOARD`) with options such as deleting an add
+     or going back to the user menu.
      """
-    button_delete = types.InlineKeyboardButton('Delete', callback_data='delete_add')
-    button_back = types.InlineKeyboardButton('Back', callback_data='back_user')
-
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(button_delete)
-    keyboard.add(button_back)
-
-    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=keyboard)
+    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=DELETE_ADD_KEYBOARD)
 
 
 def delete_user_buttons(message):
@@ -417,17 +507,10 @@ def delete_user_buttons(message):
     Parameters:
     - message (telegram.Message): The message object representing the user's interaction.
 
-    Creates an inline keyboard with options such as deleting the current user or going back to the
-    admin menu. The keyboard is then sent to the user as a message.
+    Sends the admin the inline keyboard (`DELETE_USER_KEYBOARD`) with options such as deleting a user
+    or going back to the admin menu.
     """
-    button_delete = types.InlineKeyboardButton('Delete', callback_data='delete_user')
-    button_back = types.InlineKeyboardButton('Back', callback_data='back_admin')
-
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(button_delete)
-    keyboard.add(button_back)
-
-    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=keyboard)
+    bot.send_message(message.chat.id, text='Select what you want to do', reply_markup=DELETE_USER_KEYBOARD)
 
 
 # Process new chatID step
@@ -444,7 +527,7 @@ def process_new_chat_id(message, new_add):
     """
     new_add.chat_id = message.text
     bot.send_message(message.chat.id, 'Write the text for your add:')
-    bot.register_next_step_handler(message, process_new_text, new_add)
+    set_next_step(message, process_new_text, new_add)
 
 
 # Process new text step
@@ -461,7 +544,7 @@ def process_new_text(message, new_add):
     """
     new_add.text = message.text
     bot.send_message(message.chat.id, 'Write the interval of sending the add (day, hour, minute):')
-    bot.register_next_step_handler(message, process_new_interval, new_add)
+    set_next_step(message, process_new_interval, new_add)
 
 
 # Process new interval
@@ -480,17 +563,52 @@ def process_new_interval(message, new_add):
     interval = message.text.lower()
     new_add.interval = interval
     if interval == 'day':
-        bot.send_message(message.chat.id, "What time does add must be sent at? (format - 'hh:mm')")
-        bot.register_next_step_handler(message, process_new_time_day, new_add)
+        bot.send_message(message.chat.id, "What time does add must be sent at? (format - 'hh:mm', or '-' for any)")
+        set_next_step(message, process_new_time_day, new_add)
     elif interval == 'hour':
-        bot.send_message(message.chat.id, "What time does add must be sent at? (format - ':mm')")
-        bot.register_next_step_handler(message, process_new_time_hour, new_add)
+        bot.send_message(message.chat.id, "What time does add must be sent at? (format - ':mm', or '-' for any)")
+        set_next_step(message, process_new_time_hour, new_add)
     elif interval == 'minute':
-        bot.send_message(message.chat.id, "What time does add must be sent at? (format - ':ss')")
-        bot.register_next_step_handler(message, process_new_time_minute, new_add)
+        bot.send_message(message.chat.id, "What time does add must be sent at? (format - ':ss', or '-' for any)")
+        set_next_step(message, process_new_time_minute, new_add)
     else:
         bot.send_message(message.chat.id, 'Hmm... Try again:')
-        bot.register_next_step_handler(message, process_new_interval, new_add)
+        set_next_step(message, process_new_interval, new_add)
+
+
+def save_new_add(message, new_add, step):
+    """
+    Write a new add to the database and schedule it.
+
+    Parameters:
+    - message (telegram.Message): The message object representing the user's input.
+    - new_add: An instance of the Add class representing the new add being created (with all values set).
+    - step (function): The step, which asked for the time of the add.
+
+    The add is scheduled before the insert is committed, so an add with a time, which cannot be scheduled,
+    is not saved and the user is asked for the time again (by `step`). Otherwise informs the user that the add
+    was successfully saved and returns to the user menu.
+    """
+    new_id = None
+    try:
+        with db() as (connection, cursor):
+            new_id = new_add.create_new_add(cursor, connection, commit=False)
+            # Schedule the message to be sent at the specified time
+            schedule_add(new_id, new_add.chat_id, new_add.text, new_add.interval, new_add.time)
+    except schedule.ScheduleValueError:
+        bot.send_message(message.chat.id, 'Hmm... Wrong format of the time. Try again:')
+        set_next_step(message, step, new_add)
+        return
+    except Exception:
+        # the insert was not committed, so the add must not be sent either
+        if new_id is not None:
+            unschedule_add(new_id)
+        raise
+
+    bot.send_message(message.chat.id, 'Your add was successfully saved!')
+
+    # Return to user menu
+    user(message)
 
 
 def process_new_time_day(message, new_add):
@@ -501,25 +619,16 @@ def process_new_time_day(message, new_add):
     - message (telegram.Message): The message object representing the user's input.
     - new_add: An instance of the Add class representing the new add being created.
 
-    Takes the user's input as the time for sending the new add with a daily interval.
+    Takes the user's input as the time for sending the new add with a daily interval
+    ('-' means any time, see `spread_time`).
     Writes the new add to the database, schedules the message to be sent every day at the specified time,
     and informs the user that the add was successfully saved. Finally, returns to the user menu.
+    If the time is invalid, asks for it again (see `save_new_add`).
     """
-    new_add.time = message.text
-
-    # Writing to db
-    new_add.create_new_add(cursor=cursor, connection=connection)
+    # '-' lets the server choose the time, which is the least used one
+    new_add.time = spread_time(new_add.interval) if message.text == '-' else message.text
 
-    # Schedule the message to be sent every day at a specific time (replace with your desired time)
-    job = schedule.every().day.at(new_add.time).do(send_message, new_add.chat_id, new_add.text)
-
-    cursor.execute('SELECT MAX(id) FROM adds')
-    schedule_jobs[cursor.fetchone()[0]] = job
-
-    bot.send_message(message.chat.id, 'Your add was successfully saved!')
-
-    # Return to user menu
-    user(message)
+    save_new_add(message, new_add, process_new_time_day)
 
 
 def process_new_time_hour(message, new_add):
@@ -530,25 +639,16 @@ def process_new_time_hour(message, new_add):
       - message (telegram.Message): The message object representing the user's input.
       - new_add: An instance of the Add class representing the new add being created.
 
-      Takes the user's input as the time for sending the new add with an hourly interval.
+      Takes the user's input as the time for sending the new add with an hourly interval
+      ('-' means any time, see `spread_time`).
       Writes the new add to the database, schedules the message to be sent every hour at the specified time,
       and informs the user that the add was successfully saved. Finally, returns to the user menu.
+      If the time is invalid, asks for it again (see `save_new_add`).
       """
-    new_add.time = message.text
-
-    # Writing to db
-    new_add.create_new_add(cursor=cursor, connection=connection)
-
-    # Schedule the message to be sent every day at a specific time (replace with your desired time)
-    job = schedule.every().hour.at(new_add.time).do(send_message, new_add.chat_id, new_add.text)
+    # '-' lets the server choose the time, which is the least used one
+    new_add.time = spread_time(new_add.interval) if message.text == '-' else message.text
 
-    cursor.execute('SELECT MAX(id) FROM adds')
-    schedule_jobs[cursor.fetchone()[0]] = job
-
-    bot.send_message(message.chat.id, 'Your add was successfully saved!')
-
-    # Return to user menu
-    user(message)
+    save_new_add(message, new_add, process_new_time_hour)
 
 
 # Process new time step
@@ -560,25 +660,16 @@ def process_new_time_minute(message, new_add):
       - message (telegram.Message): The message object representing the user's input.
       - new_add: An instance of the Add class representing the new add being created.
 
-      Takes the user's input as the time for sending the new add with a minute interval.
+      Takes the user's input as the time for sending the new add with a minute interval
+      ('-' means any time, see `spread_time`).
       Writes the new add to the database, schedules the message to be sent every minute at the specified time,
       and informs the user that the add was successfully saved. Finally, returns to the user menu.
+      If the time is invalid, asks for it again (see `save_new_add`).
       """
-    new_add.time = message.text
-
-    # Writing to db
-    new_add.create_new_add(cursor=cursor, connection=connection)
+    # '-' lets the server choose the time, which is the least used one
+    new_add.time = spread_time(new_add.interval) if message.text == '-' else message.text
 
-    # Schedule the message to be sent every day at a specific time (replace with your desired time)
-    job = schedule.every().minute.at(new_add.time).do(send_message, new_add.chat_id, new_add.text)
-
-    cursor.execute('SELECT MAX(id) FROM adds')
-    schedule_jobs[cursor.fetchone()[0]] = job
-
-    bot.send_message(message.chat.id, 'Your add was successfully saved!')
-
-    # Return to user menu
-    user(message)
+    save_new_add(message, new_add, process_new_time_minute)
 
 
 def process_new_login(message, new_user):
@@ -594,14 +685,16 @@ def process_new_login(message, new_user):
       in the creation process by asking the user to provide a password.
       """
     new_user.login = message.text
-    cursor.execute(f"SELECT * FROM users WHERE login = '{new_user.login}'")
-    fetched_user = cursor.fetchone()
+    with db(read_only=True) as (connection, cursor):
+        cursor.execute('SELECT 1 FROM users WHERE login = %s;', (new_user.login,))
+        fetched_user = cursor.fetchone()
     if fetched_user:
         bot.send_message(message.chat.id, 'User with this login already exists. Try again:')
-        bot.register_next_step_handler(message, process_new_login, new_user)
+        set_next_step(message, process_new_login, new_user)
+        return
     # Password
     bot.send_message(message.chat.id, 'Great! Write a password:')
-    bot.register_next_step_handler(message, process_new_password, new_user)
+    set_next_step(message, process_new_password, new_user)
 
 
 def process_new_password(message, new_user):
@@ -615,9 +708,10 @@ def process_new_password(message, new_user):
      Takes the user's input as the password for the new user and proceeds to the next step
      in the creation process by asking whether the user is an admin or not.
      """
-    new_user.password = message.text
+    # only the salted hash of the password is stored
+    new_user.password = User.hash_password(message.text)
     bot.send_message(message.chat.id, 'Is it admin? (Yes or No)')
-    bot.register_next_step_handler(message, process_new_is_admin, new_user)
+    set_next_step(message, process_new_is_admin, new_user)
 
 
 def process_new_is_admin(message, new_user):
@@ -631,7 +725,8 @@ def process_new_is_admin(message, new_user):
     Takes the user's input regarding whether the new user is an admin or not. If the answer is 'yes',
     sets the user's admin status to True; if 'no', sets it to False. If the input is not recognized,
     prompts the user to try again. Finally, writes the new user to the database and informs the user
-    that the new user has been successfully created.
+    that the new user has been successfully created. If the login has been taken in the meantime,
+    asks for another login.
     """
     answer = message.text.lower()
     if answer == 'yes':
@@ -640,14 +735,81 @@ def process_new_is_admin(message, new_user):
         new_user.is_admin = False
     else:
         bot.send_message(message.chat.id, 'Hmmm... Try again:')
-        bot.register_next_step_handler(message, process_new_is_admin, new_user)
+        set_next_step(message, process_new_is_admin, new_user)
         return
 
-    new_user.create_new_user(cursor=cursor, connection=connection)
+    # the login may have been taken since `process_new_login` checked it, the unique index rejects it then
+    try:
+        with db() as (connection, cursor):
+            new_user.create_new_user(cursor, connection, commit=False)
+    except UniqueViolation:
+        bot.send_message(message.chat.id, 'User with this login already exists. Try again:')
+        set_next_step(message, process_new_login, new_user)
+        return
     bot.send_message(message.chat.id, 'New user has been created.')
     admin(message)
 
 
+def process_next_step(message):
+    """
+    Pass a message to the step of the conversation, which is waiting for it.
+
+    Parameters:
+    - message (telegram.Message): The message object representing the user's input.
+
+    Looks up the step set by `set_next_step` for the chat, forgets it and calls it with the message
+    (the step sets the following one, if the conversation goes on).
+    """
+    step = conversation_steps.pop(message.chat.id, None)
+    if step:
+        step_function, args = step
+        step_function(message, *args)
+
+
+def create_tables():
+    """
+     Create the tables to store users and adds (and their indexes) if they do not exist.
+
+     All statements run in a single transaction, which is committed at the end of the block.
+     """
+    with db() as (connection, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            login VARCHAR(255) NOT NULL,
+            password TEXT NOT NULL,
+            isAdmin BOOLEAN
+            );
+        ''')
+
+        # The interval has only three values, so it is stored as an enum (4 bytes instead of the text)
+        cursor.execute('''
+            DO $$
+            BEGIN
+                CREATE TYPE add_interval AS ENUM ('day', 'hour', 'minute');
+            EXCEPTION
+                WHEN duplicate_object THEN NULL;
+            END
+            $$;
+        ''')
+
+        # Free space is left in every page, so updated rows can stay in the same page
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS adds (
+            id SERIAL PRIMARY KEY,
+            login VARCHAR(255) NOT NULL,
+            chat_id BIGINT NOT NULL,
+            text TEXT NOT NULL,
+            interval add_interval NOT NULL,
+            time TEXT NOT NULL
+            ) WITH (fillfactor = 90);
+        ''')
+
+        # Indexes for the lookups by login (the unique one also guarantees, that two users cannot share a login)
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS users_login_uq ON users (login);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS adds_login_idx ON adds (login);')
+
+
 # Define a function to handle the interrupt signal and clean everything up
 def clean_up(sig=None, frame=None):
     """
@@ -659,31 +821,117 @@ def clean_up(sig=None, frame=None):
 
     Stops the server, cleans up resources, and exits the program gracefully. This function is typically called
     when a termination signal (such as SIGINT or SIGTERM) is received. It sets a flag (`running_flag`) to stop
-    the main thread and waits for the thread to finish. It also stops the Telegram bot polling, closes the database
-    connection, and exits the program with a status code of 0.
+    the main thread and waits for the thread to finish. It also stops the Telegram bot polling, closes the pool of
+    database connections, and exits the program with a status code of 0.
     """
     print('\nServer stops working.')
     # Clean up resources
     # Set the flag to stop the thread
     global running_flag
     running_flag = False
+    scheduler_wakeup.set()
 
     # Wait for the thread to finish
     schedule_thread.join()
+    sender.stop()
+
+    # Log all users out
+    sessions.clear()
+    conversation_steps.clear()
 
     bot.stop_polling()
-    cursor.close()
-    connection.close()
+    close_pool()
     sys.exit(0)
 
 
-# Register the signal handler
-signal.signal(signal.SIGINT, clean_up)
+def run_webhook():
+    """
+    Receive the updates through a webhook instead of polling Telegram for them.
+
+    Registers the URL from the `webhook_url` configuration key (extended with the secret path '/<token>')
+    and a random secret token at Telegram and serves the pushed updates by `WebhookServer`
+    on `webhook_host`:`webhook_port` (updates without the secret token are rejected).
+    Telegram requires HTTPS, so the server is expected to run behind a TLS-terminating reverse proxy.
+    """
+    webhook_path = f"/{config.token}"
+    bot.remove_webhook()
+    # Telegram sends the token back in a header of every update, so nobody else can post fake updates
+    secret_token = secrets.token_urlsafe(32)
+    bot.set_webhook(url=config.webhook_url.rstrip('/') + webhook_path, secret_token=secret_token)
+
+    server = WebhookServer(bot, config.webhook_host, config.webhook_port, webhook_path, secret_token)
+    server.serve_forever()
+
+
+def register_handlers():
+    """
+    Register the handlers of the commands, the inline keyboards and the conversation steps at the bot.
+
+    The handler of the conversation steps is registered last, so /start and /exit are handled by their own
+    handlers even in the middle of a step.
+    """
+    bot.register_message_handler(start, commands=['start'])
+    bot.register_message_handler(log_out, commands=['exit'])
+    bot.register_callback_query_handler(handle_callback_query, func=lambda call: True)
+    bot.register_message_handler(process_next_step, func=lambda message: message.chat.id in conversation_steps)
+
+
+def main():
+    """
+    Start the server with the configuration file given as a command-line argument.
+
+    Loads the configuration, initializes the bot, the sender of adds and the pool of database connections,
+    creates the tables, schedules the saved adds and receives the updates from Telegram (through a webhook
+    or by polling) until the server is stopped.
+    """
+    global config, bot, sender, schedule_thread
+
+    if len(sys.argv) != 2:
+        print("Usage: python main.py <config_file>")
+        sys.exit(1)
+
+    # getting configuration from the inputted as CLI parameter json file
+    config = load_config(sys.argv[1])
+
+    # Initialize the bot (the handlers run in a pool of `worker_threads` threads, so a slow query of one user
+    # does not hold up the others)
+    bot = telebot.TeleBot(config.token, num_threads=config.worker_threads)
+    register_handlers()
+
+    # Queue of scheduled adds, which are sent from a separate thread within the rate limits of Telegram
+    sender = RateLimitedSender(bot)
+    sender.start()
+
+    # Open the pool of database connections shared by the bot and the schedule threads
+    # (every handler borrows a connection only for the time of its queries)
+    init_pool(config.db_config)
+
+    create_tables()
+
+    # Schedule the adds saved before the server was started
+    load_scheduled_adds()
+
+    # Create a thread for the schedule and start it (only now, so it does not keep a server, which failed
+    # to start, running)
+    schedule_thread = threading.Thread(target=schedule_thread_func)
+    schedule_thread.start()
+
+    # Register the signal handler (SIGTERM is sent by service managers and `docker stop`)
+    signal.signal(signal.SIGINT, clean_up)
+    signal.signal(signal.SIGTERM, clean_up)
 
-if __name__ == '__main__':
     try:
         print('Server starts working.')
-        bot.infinity_polling()
+        if config.webhook_url:
+            run_webhook()
+        else:
+            # Polling does not work while a webhook (e.g. from a previous run) is registered
+            bot.remove_webhook()
+            bot.infinity_polling()
     except Exception as e:
         print(f"An error occurred: {e}")
         clean_up()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,7 @@
-import sys
+import pytest
 
-# I have not found another way to import module from another folder in python (spent 1 hour with that)
-sys.path.insert(1, '/Users/aleksejgrachev/Desktop/Study/5th Semester/PYT/grachale')
-
-from unittest.mock import MagicMock
-from app.src.helpers.advert import Add
+from unittest.mock import MagicMock, patch
+from app.src.helpers.advert import Add, AddRow
 
 
 def test_init_with_add_tuple():
@@ -22,6 +19,13 @@ def test_init_with_add_tuple():
 def test_init_without_add_tuple():
     add_instance = Add()
 
+    with pytest.raises(AttributeError):
+        add_instance.login
+
+
+def test_empty():
+    add_instance = Add.empty()
+
     assert add_instance.id is None
     assert add_instance.login is None
     assert add_instance.chat_id is None
@@ -30,8 +34,18 @@ def test_init_without_add_tuple():
     assert add_instance.time is None
 
 
+def test_from_row():
+    add_instance = Add.from_row((2, 'user', '123456', 'Test add', 'minute', ':15'))
+
+    assert add_instance.id == 2
+    assert add_instance.interval == 'minute'
+    assert add_instance.time == ':15'
+    assert not hasattr(add_instance, '__dict__')
+
+
 def test_create_new_add():
     mock_cursor = MagicMock()
+    mock_cursor.fetchone.return_value = (7,)
     mock_connection = MagicMock()
 
     add_instance = Add()
@@ -41,10 +55,117 @@ def test_create_new_add():
     add_instance.interval = 'hour'
     add_instance.time = '12:30'
 
-    add_instance.create_new_add(mock_cursor, mock_connection)
+    new_id = add_instance.create_new_add(mock_cursor, mock_connection)
+
+    mock_cursor.execute.assert_called_once_with(
+        'INSERT INTO adds (login, chat_id, "text", "interval", "time") VALUES (%s, %s, %s, %s, %s) RETURNING id;',
+        ('user', '123456', 'Test add', 'hour', '12:30')
+    )
+    mock_connection.commit.assert_called_once()
+    assert new_id == 7
+    assert add_instance.id == 7
+
+
+def test_bulk_insert():
+    mock_cursor = MagicMock()
+    mock_connection = MagicMock()
+
+    adds = []
+    for number in range(3):
+        add_instance = Add()
+        add_instance.login = 'user'
+        add_instance.chat_id = '123456'
+        add_instance.text = f'Test add {number}'
+        add_instance.interval = 'hour'
+        add_instance.time = ':30'
+        adds.append(add_instance)
+
+    with patch('app.src.helpers.advert.execute_values') as mock_execute_values:
+        Add.bulk_insert(mock_cursor, mock_connection, adds, batch_size=2)
+
+    assert mock_execute_values.call_count == 2
+    cursor, sql, rows = mock_execute_values.call_args_list[0].args
+    assert cursor is mock_cursor
+    assert sql == 'INSERT INTO adds (login, chat_id, "text", "interval", "time") VALUES %s;'
+    assert rows == [('user', '123456', 'Test add 0', 'hour', ':30'),
+                    ('user', '123456', 'Test add 1', 'hour', ':30')]
+    assert mock_connection.commit.call_count == 2
+
+
+def test_copy_insert():
+    mock_connection = MagicMock()
+    mock_cursor = mock_connection.cursor.return_value.__enter__.return_value
+
+    add_instance = Add((None, 'user', '123456', 'Hello, "world"', 'day', '12:30'))
+    Add.copy_insert(mock_connection, [add_instance])
+
+    sql, buffer = mock_cursor.copy_expert.call_args.args
+    assert sql == 'COPY adds (login, chat_id, "text", "interval", "time") FROM STDIN WITH (FORMAT CSV);'
+    assert buffer.read() == 'user,123456,"Hello, ""world""",day,12:30\r\n'
+    mock_connection.commit.assert_called_once()
+
+
+def test_update_many():
+    mock_cursor = MagicMock()
+    mock_connection = MagicMock()
+
+    adds = [Add((1, 'user', '123456', 'New text', 'day', '10:00')),
+            Add((2, 'user', '654321', 'Other text', 'minute', ':05'))]
+    with patch('app.src.helpers.advert.execute_values') as mock_execute_values:
+        Add.update_many(mock_cursor, mock_connection, adds)
+
+    mock_execute_values.assert_called_once()
+    cursor, sql, rows = mock_execute_values.call_args.args
+    assert cursor is mock_cursor
+    assert sql.startswith('UPDATE adds SET')
+    assert rows == [(1, 'user', '123456', 'New text', 'day', '10:00'),
+                    (2, 'user', '654321', 'Other text', 'minute', ':05')]
+    mock_connection.commit.assert_called_once()
+
+
+def test_delete_many():
+    mock_cursor = MagicMock()
+    mock_cursor.rowcount = 2
+    mock_connection = MagicMock()
+
+    deleted = Add.delete_many(mock_cursor, mock_connection, (id_ for id_ in [1, 2]))
+
+    mock_cursor.execute.assert_called_once_with('DELETE FROM adds WHERE id = ANY(%s);', ([1, 2],))
+    mock_connection.commit.assert_called_once()
+    assert deleted == 2
+
+
+def test_rows():
+    mock_cursor = MagicMock()
+    mock_cursor.__iter__.return_value = iter([(1, 'user', '123456', 'Test add', 'day', '12:30')])
+
+    rows = Add.rows(mock_cursor)
+
+    mock_cursor.execute.assert_called_once_with('SELECT id, login, chat_id, "text", "interval", "time" FROM adds;')
+    assert rows == [AddRow(1, 'user', '123456', 'Test add', 'day', '12:30')]
+    assert rows[0].chat_id == '123456'
+
+
+def test_due_now():
+    mock_cursor = MagicMock()
+    mock_cursor.__iter__.return_value = iter([(3, 'user', '123456', 'Test add', 'day', '09:00')])
+
+    rows = Add.due_now(mock_cursor, '09:00')
 
     mock_cursor.execute.assert_called_once_with(
-        "\n            INSERT INTO adds (login, chat_id, text, interval, time) "
-        "VALUES ('user', '123456', 'Test add', 'hour', '12:30');\n        "
+        'SELECT id, login, chat_id, "text", "interval", "time" FROM adds WHERE "time" = %s;', ('09:00',)
     )
-    mock_connection.commit.assert_called_once()
\ No newline at end of file
+    assert rows == [AddRow(3, 'user', '123456', 'Test add', 'day', '09:00')]
+
+
+def test_iter_due_is_lazy():
+    mock_cursor = MagicMock()
+    mock_cursor.__iter__.return_value = iter([(3, 'user', '123456', 'Test add', 'day', '09:00'),
+                                              (4, 'user', '654321', 'Other add', 'day', '09:00')])
+
+    due = Add.iter_due(mock_cursor, '09:00')
+    mock_cursor.execute.assert_not_called()
+
+    assert next(due).chat_id == '123456'
+    mock_cursor.execute.assert_called_once()
+    assert [row.id for row in due] == [4]
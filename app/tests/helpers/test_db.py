@@ -0,0 +1,133 @@
+import pytest
+
+from unittest.mock import MagicMock, patch
+from app.src.helpers.db import close_pool, db, execute_prepared, init_pool, transaction, tune_session
+from app.src.helpers.user import User
+
+
+def test_transaction_commits_once():
+    mock_cursor = MagicMock()
+    mock_connection = MagicMock()
+
+    with transaction(mock_connection):
+        for login in ('first_user', 'second_user'):
+            user_instance = User()
+            user_instance.login = login
+            user_instance.password = 'password123'
+            user_instance.is_admin = False
+            user_instance.create_new_user(mock_cursor, mock_connection, commit=False)
+
+    assert mock_cursor.execute.call_count == 2
+    mock_connection.commit.assert_called_once()
+    mock_connection.rollback.assert_not_called()
+
+
+def test_transaction_turns_autocommit_off():
+    mock_connection = MagicMock()
+    mock_connection.autocommit = True
+
+    with transaction(mock_connection):
+        assert mock_connection.autocommit is False
+
+    assert mock_connection.autocommit is True
+    mock_connection.commit.assert_called_once()
+
+
+def test_transaction_rolls_back_on_error():
+    mock_connection = MagicMock()
+
+    with pytest.raises(ValueError):
+        with transaction(mock_connection):
+            raise ValueError('Test error')
+
+    mock_connection.rollback.assert_called_once()
+    mock_connection.commit.assert_not_called()
+
+
+def test_create_new_user_borrows_connection_from_pool():
+    with patch('app.src.helpers.db.ThreadedConnectionPool') as mock_pool_class:
+        init_pool({'host': 'localhost', 'database': 'test_db'})
+        mock_pool = mock_pool_class.return_value
+        mock_connection = mock_pool.getconn.return_value
+        mock_cursor = mock_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (3,)
+        try:
+            user_instance = User()
+            user_instance.login = 'test_user'
+            user_instance.password = 'password123'
+            user_instance.is_admin = False
+            assert user_instance.create_new_user() == 3
+        finally:
+            close_pool()
+
+    mock_cursor.execute.assert_called_once()
+    mock_connection.commit.assert_called_once()
+    mock_pool.putconn.assert_called_once_with(mock_connection)
+
+
+def test_db_without_pool():
+    with pytest.raises(RuntimeError):
+        with db():
+            pass
+
+
+def test_tune_session():
+    mock_cursor = MagicMock()
+    mock_connection = MagicMock()
+
+    tune_session(mock_cursor, mock_connection)
+
+    mock_cursor.execute.assert_called_once_with('SET synchronous_commit TO OFF;')
+    mock_connection.commit.assert_called_once()
+
+
+def test_db_returns_connection_to_pool():
+    with patch('app.src.helpers.db.ThreadedConnectionPool') as mock_pool_class:
+        init_pool({'host': 'localhost', 'database': 'test_db'})
+        mock_pool = mock_pool_class.return_value
+        mock_connection = mock_pool.getconn.return_value
+        try:
+            with pytest.raises(ValueError):
+                with db() as (connection, cursor):
+                    assert connection is mock_connection
+                    cursor.execute('SELECT 1')
+                    raise ValueError('Test error')
+
+            with db() as (connection, cursor):
+                cursor.execute('SELECT 1')
+        finally:
+            close_pool()
+
+    assert mock_pool.putconn.call_count == 2
+    mock_connection.rollback.assert_called_once()
+    mock_connection.commit.assert_called_once()
+    mock_pool.closeall.assert_called_once()
+
+
+def test_db_read_only_does_not_commit():
+    with patch('app.src.helpers.db.ThreadedConnectionPool') as mock_pool_class:
+        init_pool({'host': 'localhost', 'database': 'test_db'})
+        mock_pool = mock_pool_class.return_value
+        mock_connection = mock_pool.getconn.return_value
+        try:
+            with db(read_only=True) as (connection, cursor):
+                cursor.execute('SELECT 1')
+        finally:
+            close_pool()
+
+    mock_pool.putconn.assert_called_once_with(mock_connection)
+    mock_connection.commit.assert_not_called()
+
+
+def test_execute_prepared_prepares_once():
+    mock_cursor = MagicMock()
+    mock_cursor.connection.prepared = set()
+
+    execute_prepared(mock_cursor, 'login_lookup', 'SELECT id FROM users WHERE login = $1', ('user',))
+    execute_prepared(mock_cursor, 'login_lookup', 'SELECT id FROM users WHERE login = $1', ('admin',))
+
+    assert [call.args for call in mock_cursor.execute.call_args_list] == [
+        ('PREPARE login_lookup AS SELECT id FROM users WHERE login = $1;',),
+        ('EXECUTE login_lookup (%s);', ('user',)),
+        ('EXECUTE login_lookup (%s);', ('admin',)),
+    ]
@@ -0,0 +1,81 @@
+import time
+
+from unittest.mock import MagicMock
+from telebot.apihelper import ApiTelegramException
+from app.src.helpers.sender import RateLimitedSender
+
+
+def test_send_spaces_messages_to_same_chat():
+    mock_bot = MagicMock()
+    sent_at = []
+    mock_bot.send_message.side_effect = lambda chat_id, text: sent_at.append(time.monotonic())
+
+    sender = RateLimitedSender(mock_bot, per_chat_interval=0.1)
+    sender.start()
+    sender.send(123456, 'First add')
+    sender.send(123456, 'Second add')
+    sender.stop()
+
+    assert [call.args for call in mock_bot.send_message.call_args_list] == [(123456, 'First add'),
+                                                                            (123456, 'Second add')]
+    assert sent_at[1] - sent_at[0] >= 0.09
+
+
+def test_default_interval_per_chat():
+    assert RateLimitedSender(MagicMock()).per_chat_interval == 1.0
+
+
+def test_chat_cooling_down_does_not_block_other_chats():
+    mock_bot = MagicMock()
+    sent_at = []
+    mock_bot.send_message.side_effect = lambda chat_id, text: sent_at.append(time.monotonic())
+
+    sender = RateLimitedSender(mock_bot, per_chat_interval=0.2)
+    sender.start()
+    sender.send(123456, 'First add')
+    sender.send(123456, 'Second add')
+    sender.send(654321, 'Other add')
+    sender.stop()
+
+    # the message to the other chat is not queued behind the second message to the first chat
+    assert [call.args for call in mock_bot.send_message.call_args_list] == [(123456, 'First add'),
+                                                                            (654321, 'Other add'),
+                                                                            (123456, 'Second add')]
+    assert sent_at[1] - sent_at[0] < 0.1
+    assert sent_at[2] - sent_at[0] >= 0.19
+
+
+def test_send_retries_after_too_many_requests():
+    mock_bot = MagicMock()
+    too_many_requests = ApiTelegramException('sendMessage', None, {'error_code': 429,
+                                                                   'description': 'Too Many Requests',
+                                                                   'parameters': {'retry_after': 0.2}})
+    mock_bot.send_message.side_effect = [too_many_requests, None, None, None]
+
+    sender = RateLimitedSender(mock_bot, per_chat_interval=0)
+    sender.start()
+    sender.send(123456, 'Test add')
+    sender.send(123456, 'Next add')
+    sender.send(654321, 'Other add')
+    sender.stop()
+
+    # the rejected message is sent again before the next one to its chat, other chats do not wait for it
+    assert [call.args for call in mock_bot.send_message.call_args_list] == [(123456, 'Test add'),
+                                                                            (654321, 'Other add'),
+                                                                            (123456, 'Test add'),
+                                                                            (123456, 'Next add')]
+
+
+def test_send_gives_up_after_max_retries():
+    mock_bot = MagicMock()
+    too_many_requests = ApiTelegramException('sendMessage', None, {'error_code': 429,
+                                                                   'description': 'Too Many Requests',
+                                                                   'parameters': {'retry_after': 0}})
+    mock_bot.send_message.side_effect = too_many_requests
+
+    sender = RateLimitedSender(mock_bot, per_chat_interval=0, max_retries=2)
+    sender.start()
+    sender.send(123456, 'Test add')
+    sender.stop()
+
+    assert mock_bot.send_message.call_count == 3
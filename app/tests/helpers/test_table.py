@@ -0,0 +1,31 @@
+from app.src.helpers.table import format_table, paginate_table
+
+
+def test_format_table():
+    table = format_table(['ID', 'Login', 'isAdmin'], [(1, 'admin', True), (2, 'test_user', False)])
+
+    assert table == 'ID | Login | isAdmin\n1 | admin | True\n2 | test_user | False'
+
+
+def test_paginate_table_by_rows():
+    rows = [(user_id, f'user{user_id}') for user_id in range(5)]
+
+    pages = list(paginate_table(['ID', 'Login'], rows, rows_per_page=2))
+
+    assert pages == ['ID | Login\n0 | user0\n1 | user1',
+                     'ID | Login\n2 | user2\n3 | user3',
+                     'ID | Login\n4 | user4']
+
+
+def test_paginate_table_by_length():
+    rows = [(1, 'a' * 10), (2, 'b' * 10), (3, 'c' * 100)]
+
+    pages = list(paginate_table(['ID', 'Text'], rows, max_length=40))
+
+    assert all(len(page) <= 40 for page in pages)
+    assert pages[0] == 'ID | Text\n1 | aaaaaaaaaa\n2 | bbbbbbbbbb'
+    assert pages[1].startswith('ID | Text\n3 | ccc')
+
+
+def test_paginate_empty_table():
+    assert list(paginate_table(['ID'], [])) == []
@@ -1,10 +1,7 @@
-import sys
+import pytest
 
-# I have not found another way to import module from another folder in python (spent 2 hours with that)
-sys.path.insert(1, '/Users/aleksejgrachev/Desktop/Study/5th Semester/PYT/grachale')
-
-from unittest.mock import MagicMock
-from app.src.helpers.user import User
+from unittest.mock import MagicMock, patch
+from app.src.helpers.user import User, UserRow
 
 
 def test_init_with_user_tuple():
@@ -20,14 +17,57 @@ def test_init_with_user_tuple():
 def test_init_without_user_tuple():
     user_instance = User()
 
+    with pytest.raises(AttributeError):
+        user_instance.login
+
+
+def test_empty():
+    user_instance = User.empty()
+
     assert user_instance.user_id is None
     assert user_instance.login is None
     assert user_instance.password is None
     assert user_instance.is_admin is None
 
 
+def test_from_row():
+    user_instance = User.from_row((2, 'admin', 'password123', True))
+
+    assert user_instance.user_id == 2
+    assert user_instance.login == 'admin'
+    assert user_instance.is_admin is True
+    assert not hasattr(user_instance, '__dict__')
+
+
+def test_hash_password():
+    user_instance = User.from_row((1, 'test_user', User.hash_password('password123'), False))
+
+    assert user_instance.password.startswith('scrypt$')
+    assert 'password123' not in user_instance.password
+    assert user_instance.check_password('password123') is True
+    assert user_instance.check_password('password124') is False
+
+
+def test_check_plain_text_password():
+    user_instance = User.from_row((1, 'test_user', 'password123', False))
+
+    assert user_instance.check_password('password123') is True
+    assert user_instance.check_password('wrong_password') is False
+    assert user_instance.needs_rehash() is True
+    assert User.from_row((1, 'test_user', User.hash_password('password123'), False)).needs_rehash() is False
+
+
+def test_check_malformed_password():
+    for password in ('scrypt$not_hex$00', 'scrypt$00$not_hex', 'scrypt$', 'scrypt$0$0'):
+        user_instance = User.from_row((1, 'test_user', password, False))
+
+        assert user_instance.check_password('password123') is False
+        assert user_instance.needs_rehash() is False
+
+
 def test_create_new_user():
     mock_cursor = MagicMock()
+    mock_cursor.fetchone.return_value = (3,)
     mock_connection = MagicMock()
 
     user_instance = User()
@@ -35,10 +75,72 @@ def test_create_new_user():
     user_instance.password = 'new_password'
     user_instance.is_admin = False
 
-    user_instance.create_new_user(mock_cursor, mock_connection)
+    new_id = user_instance.create_new_user(mock_cursor, mock_connection)
 
     mock_cursor.execute.assert_called_once_with(
-        "\n            INSERT INTO users (login, password, isAdmin) "
-        "VALUES ('new_user', 'new_password', False);\n        "
+        'INSERT INTO users (login, password, isAdmin) VALUES (%s, %s, %s) RETURNING id;',
+        ('new_user', 'new_password', False)
+    )
+    mock_connection.commit.assert_called_once()
+    assert new_id == 3
+    assert user_instance.user_id == 3
+
+
+def test_bulk_insert():
+    mock_cursor = MagicMock()
+    mock_connection = MagicMock()
+
+    users = []
+    for login in ('first_user', 'second_user'):
+        user_instance = User()
+        user_instance.login = login
+        user_instance.password = 'password123'
+        user_instance.is_admin = False
+        users.append(user_instance)
+
+    with patch('app.src.helpers.user.execute_values') as mock_execute_values:
+        User.bulk_insert(mock_cursor, mock_connection, users)
+
+    mock_execute_values.assert_called_once_with(
+        mock_cursor,
+        'INSERT INTO users (login, password, isAdmin) VALUES %s;',
+        [('first_user', 'password123', False), ('second_user', 'password123', False)],
+        page_size=1000
     )
     mock_connection.commit.assert_called_once()
+
+
+def test_copy_insert():
+    mock_connection = MagicMock()
+    mock_cursor = mock_connection.cursor.return_value.__enter__.return_value
+
+    users = [User((None, 'first_user', 'password123', False)), User((None, 'admin', 'secret', True))]
+    User.copy_insert(mock_connection, users)
+
+    sql, buffer = mock_cursor.copy_expert.call_args.args
+    assert sql == 'COPY users (login, password, isAdmin) FROM STDIN WITH (FORMAT CSV);'
+    assert buffer.read() == 'first_user,password123,False\r\nadmin,secret,True\r\n'
+    mock_connection.commit.assert_called_once()
+
+
+def test_delete_many():
+    mock_cursor = MagicMock()
+    mock_cursor.rowcount = 1
+    mock_connection = MagicMock()
+
+    deleted = User.delete_many(mock_cursor, mock_connection, {5})
+
+    mock_cursor.execute.assert_called_once_with('DELETE FROM users WHERE id = ANY(%s);', ([5],))
+    mock_connection.commit.assert_called_once()
+    assert deleted == 1
+
+
+def test_rows():
+    mock_cursor = MagicMock()
+    mock_cursor.__iter__.return_value = iter([(1, 'admin', 'password123', True)])
+
+    rows = User.rows(mock_cursor)
+
+    mock_cursor.execute.assert_called_once_with('SELECT id, login, password, isAdmin FROM users;')
+    assert rows == [UserRow(1, 'admin', 'password123', True)]
+    assert rows[0].is_admin is True
@@ -0,0 +1,54 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from unittest.mock import MagicMock
+from app.src.helpers.webhook import WebhookServer
+
+
+@pytest.fixture
+def webhook_server():
+    server = WebhookServer(MagicMock(), '127.0.0.1', 0, '/test_token', 'test_secret')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def post(server, path, data, secret_token='test_secret'):
+    url = f'http://127.0.0.1:{server.server_address[1]}{path}'
+    headers = {} if secret_token is None else {'X-Telegram-Bot-Api-Secret-Token': secret_token}
+    request = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers=headers, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def test_update_is_passed_to_bot(webhook_server):
+    status = post(webhook_server, '/test_token', {'update_id': 1})
+
+    assert status == 200
+    webhook_server.bot.process_new_updates.assert_called_once()
+    update, = webhook_server.bot.process_new_updates.call_args.args[0]
+    assert update.update_id == 1
+
+
+def test_wrong_path_is_rejected(webhook_server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(webhook_server, '/wrong_token', {'update_id': 1})
+
+    assert error.value.code == 404
+    webhook_server.bot.process_new_updates.assert_not_called()
+
+
+def test_wrong_secret_token_is_rejected(webhook_server):
+    for secret_token in ('wrong_secret', None):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(webhook_server, '/test_token', {'update_id': 1}, secret_token)
+
+        assert error.value.code == 403
+    webhook_server.bot.process_new_updates.assert_not_called()
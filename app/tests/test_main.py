@@ -1,80 +1,440 @@
-import json
-import sys
 import os
-import unittest
+from contextlib import contextmanager
 
-from unittest.mock import MagicMock
+import pytest
+import schedule
+from psycopg2.errors import UniqueViolation
 
+from unittest.mock import MagicMock, patch
 
-# Copied functions from main.py to prevent execution of main.py while importing (could not make up something else)
-def load_config(path):
-    """
-        Load configuration data from a JSON file.
+import main
+from helpers.config import Config, clear_load_config_cache, load_config
 
-        Parameters:
-        - path (str): The path to the JSON configuration file.
 
-        Returns:
-        - dict: A dictionary containing the configuration data.
+@pytest.fixture(scope='module')
+def valid_config_path(tmp_path_factory):
+    # The test configuration file is created once for all tests of the module (and removed by pytest)
+    config_path = tmp_path_factory.mktemp('config') / 'config.json'
+    config_path.write_text('{"token": "test_token", '
+                           '"db_config": {"host": "localhost", "user": "test_user", '
+                           '"password": "test_password", "database": "test_db"}}')
+    return config_path
 
-        Raises:
-        - FileNotFoundError: If the specified configuration file is not found.
-        - json.JSONDecodeError: If there is an issue parsing the JSON data.
-
-        The function attempts to open and read the specified JSON file at the given path.
-        If successful, it parses the JSON content and returns the configuration data as a dictionary.
-        """
-    try:
-        with open(path, encoding='utf-8') as config_file:
-            config_data = json.load(config_file)
-        return config_data
-    except FileNotFoundError:
-        print(f"Error: Configuration file '{path}' not found.")
-        sys.exit(1)
-    except json.JSONDecodeError:
-        print(f"Error: Unable to parse JSON in '{path}'.")
-        sys.exit(1)
-
-
-def test_load_config_valid_file():
-    config_path = 'config.json'
-
-    # Create the test configuration file
-    with open(config_path, 'w') as config_file:
-        config_file.write('{"token": "test_token", '
-                          '"db_config": {"host": "localhost", "user": "test_user", '
-                          '"password": "test_password", "database": "test_db"}}')
 
+def test_load_config_valid_file(valid_config_path):
     # Run the function to load the configuration
-    result = load_config(config_path)
+    result = load_config(valid_config_path)
 
     # Assert the result
-    assert result == {"token": "test_token",
-                      "db_config": {"host": "localhost", "user": "test_user",
-                                    "password": "test_password", "database": "test_db"}}
+    assert result == Config(token="test_token",
+                            db_config={"host": "localhost", "user": "test_user",
+                                       "password": "test_password", "database": "test_db"})
+    assert result.worker_threads == 4
+
+
+def test_load_config_is_read_only(valid_config_path):
+    result = load_config(valid_config_path)
+
+    with pytest.raises(TypeError):
+        result.db_config['host'] = 'example.com'
+    assert load_config(valid_config_path).db_config['host'] == 'localhost'
+
+
+def test_server_uses_tested_load_config():
+    # the server script imports the same module, so the tests cover the function the server runs
+    assert main.load_config is load_config
+
+
+def test_load_config_accepts_str_path(valid_config_path):
+    assert load_config(str(valid_config_path)).db_config['database'] == 'test_db'
+
+
+def test_load_config_with_byte_order_mark(tmp_path):
+    config_path = tmp_path / 'config.json'
+    config_path.write_bytes(b'\xef\xbb\xbf{"token": "test_token", "db_config": {}}')
+
+    assert load_config(config_path).token == "test_token"
+
+
+def test_load_config_large_file(tmp_path):
+    config_path = tmp_path / 'config.json'
+    config_path.write_bytes(b'\xef\xbb\xbf{"token": "' + b'a' * 5000 + b'", "db_config": {}}')
+
+    assert load_config(config_path).token == 'a' * 5000
 
-    # Delete the created file after the test
-    os.remove(config_path)
 
+def test_load_config_is_cached_until_modified(tmp_path):
+    config_path = tmp_path / 'cached_config.json'
+    config_path.write_text('{"token": "test_token", "db_config": {}}')
+
+    try:
+        first_result = load_config(config_path)
+        assert load_config(config_path) is first_result
+
+        config_path.write_text('{"token": "new_token", "db_config": {}}')
+        # make sure the modification time changes even on file systems with a coarse resolution
+        os.utime(config_path, ns=(0, config_path.stat().st_mtime_ns + 10 ** 9))
+
+        assert load_config(config_path).token == "new_token"
+    finally:
+        clear_load_config_cache()
 
-def test_load_config_file_not_found():
-    config_path = 'nonexistent_config.json'
 
-    with unittest.mock.patch('sys.exit') as mock_exit:
+def test_load_config_file_not_found(tmp_path):
+    config_path = tmp_path / 'nonexistent_config.json'
+
+    with pytest.raises(SystemExit, match='not found'):
         load_config(config_path)
 
-    mock_exit.assert_called_once_with(1)
+
+def test_load_config_directory(tmp_path):
+    with pytest.raises(SystemExit, match='not found'):
+        load_config(tmp_path)
 
 
-def test_load_config_invalid_json():
-    config_path = 'invalid_config.json'
-    with open(config_path, 'w') as config_file:
-        config_file.write('{"token": "test_token", '
-                          '"db_config": {"host": "localhost", "user": "test_user", '
-                          '"password": "test_password", "database": "test_db"')
+def test_load_config_invalid_json(tmp_path):
+    config_path = tmp_path / 'invalid_config.json'
+    config_path.write_text('{"token": "test_token", '
+                           '"db_config": {"host": "localhost", "user": "test_user", '
+                           '"password": "test_password", "database": "test_db"')
 
-    with unittest.mock.patch('sys.exit') as mock_exit:
+    with pytest.raises(SystemExit, match='Unable to parse JSON'):
         load_config(config_path)
 
-    mock_exit.assert_called_once_with(1)
-    os.remove(config_path)
+
+def test_load_config_invalid_schema(tmp_path):
+    for content in ('["test_token"]',
+                    '{"db_config": {}}',
+                    '{"token": "test_token", "db_config": {}, "webhook_port": "8443"}',
+                    '{"token": "test_token", "db_config": {}, "worker_threads": true}',
+                    '{"token": "test_token", "db_config": {}, "tokne": "test_token"}'):
+        config_path = tmp_path / 'invalid_config.json'
+        config_path.write_text(content)
+
+        with pytest.raises(SystemExit, match='Invalid configuration'):
+            load_config(config_path)
+        clear_load_config_cache()
+
+
+@pytest.fixture
+def clean_schedule():
+    # every test starts and ends without any scheduled job
+    schedule.clear()
+    main.schedule_jobs.clear()
+    yield
+    schedule.clear()
+    main.schedule_jobs.clear()
+    main.scheduler_wakeup.clear()
+
+
+@pytest.fixture
+def mock_bot():
+    # the handlers talk to a mocked bot and no conversation is going on before and after the test
+    main.conversation_steps.clear()
+    main.sessions.clear()
+    with patch.object(main, 'bot', MagicMock()) as bot:
+        yield bot
+    main.conversation_steps.clear()
+    main.sessions.clear()
+
+
+def mock_db(connection):
+    # replacement of `main.db`, which yields the given connection and its cursor instead of a pooled one
+    @contextmanager
+    def db(read_only=False):
+        yield connection, connection.cursor.return_value
+    return patch.object(main, 'db', db)
+
+
+def make_message(text, chat_id=42):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = chat_id
+    return message
+
+
+def test_spread_time_without_jobs(clean_schedule):
+    assert main.spread_time('minute') == ':00'
+    assert main.spread_time('hour') == ':00'
+    # daily adds are not sent at night
+    assert main.spread_time('day') == '09:00'
+
+
+def test_spread_time_picks_least_used_slot(clean_schedule):
+    for at_time in ('09:00', '09:00', '10:00', '11:00'):
+        schedule.every().day.at(at_time).do(print)
+
+    # 12:00 is the earliest unused hour of the day
+    assert main.spread_time('day') == '12:00'
+
+    for hour in range(12, 21):
+        schedule.every().day.at(f'{hour:02d}:00').do(print)
+
+    # all hours are used, the earliest of the least used ones wins
+    assert main.spread_time('day') == '10:00'
+
+
+def test_spread_time_ignores_other_jobs(clean_schedule):
+    # jobs of other units and daily jobs outside of the allowed hours do not count
+    schedule.every().hour.at(':09').do(print)
+    schedule.every().minute.at(':09').do(print)
+    schedule.every().day.at('03:00').do(print)
+    schedule.every().day.at('09:00').do(print)
+
+    assert main.spread_time('day') == '10:00'
+    assert main.spread_time('hour') == ':00'
+
+    schedule.every().hour.at(':00').do(print)
+
+    assert main.spread_time('hour') == ':01'
+    assert main.spread_time('minute') == ':00'
+
+
+def test_schedule_add(clean_schedule):
+    job = main.schedule_add(1, 100, 'Buy now!', 'hour', ':15')
+
+    assert main.schedule_jobs == {1: job}
+    assert schedule.get_jobs() == [job]
+    assert job.unit == 'hours' and job.at_time.minute == 15
+    assert job.job_func.args == (100, 'Buy now!')
+    # the schedule thread is woken up to take the new job into account
+    assert main.scheduler_wakeup.is_set()
+
+
+def test_unschedule_add(clean_schedule):
+    main.schedule_add(1, 100, 'Buy now!', 'day', '10:00')
+    other_job = main.schedule_add(2, 100, 'Sale!', 'minute', ':30')
+
+    main.unschedule_add(1)
+    # unknown adds are ignored
+    main.unschedule_add(3)
+
+    assert main.schedule_jobs == {2: other_job}
+    assert schedule.get_jobs() == [other_job]
+
+
+def test_load_scheduled_adds(clean_schedule):
+    mock_connection = MagicMock()
+    adds_cursor = mock_connection.cursor.return_value.__enter__.return_value
+    adds_cursor.__iter__.return_value = iter([(1, 'user', 100, 'Buy now!', 'day', '10:00'),
+                                              (2, 'user', 100, 'Broken', 'minute', '10:00'),
+                                              (3, 'user', 200, 'Sale!', 'minute', ':30')])
+
+    with mock_db(mock_connection):
+        main.load_scheduled_adds()
+
+    # the adds are streamed through a named cursor and the add with an invalid time is skipped
+    mock_connection.cursor.assert_called_with(name='load_adds')
+    assert adds_cursor.itersize == 1000
+    assert sorted(main.schedule_jobs) == [1, 3]
+    assert main.schedule_jobs[1].unit == 'days'
+    assert main.schedule_jobs[3].job_func.args == (200, 'Sale!')
+
+
+def test_step_is_consumed_once(mock_bot):
+    step = MagicMock()
+    message = make_message('answer')
+
+    main.set_next_step(message, step, 'extra')
+    main.process_next_step(message)
+    main.process_next_step(message)
+
+    step.assert_called_once_with(message, 'extra')
+    assert message.chat.id not in main.conversation_steps
+
+
+def test_step_replaces_previous_one(mock_bot):
+    first_step, second_step = MagicMock(), MagicMock()
+    message = make_message('answer')
+
+    main.set_next_step(message, first_step)
+    main.set_next_step(message, second_step)
+    main.process_next_step(message)
+
+    first_step.assert_not_called()
+    second_step.assert_called_once_with(message)
+
+
+def test_exit_clears_pending_step(mock_bot):
+    message = make_message('/start')
+    main.start(message)
+    assert main.conversation_steps[message.chat.id][0] is main.process_login_step
+    main.sessions[message.chat.id] = MagicMock()
+
+    main.log_out(make_message('/exit'))
+
+    assert message.chat.id not in main.conversation_steps
+    assert message.chat.id not in main.sessions
+    # a message sent after /exit is not taken as a login
+    with patch.object(main, 'process_login_step') as process_login_step:
+        main.process_next_step(make_message('admin'))
+    process_login_step.assert_not_called()
+
+
+def test_delete_add_cancels_its_job(mock_bot, clean_schedule):
+    main.schedule_add(7, 100, 'Buy now!', 'minute', ':00')
+    other_job = main.schedule_add(8, 100, 'Sale!', 'minute', ':30')
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.fetchone.return_value = (7,)
+
+    with mock_db(mock_connection):
+        main.set_next_step(make_message('7'), main.delete_add)
+        main.process_next_step(make_message('7'))
+
+    assert main.schedule_jobs == {8: other_job}
+    assert schedule.get_jobs() == [other_job]
+    mock_bot.send_message.assert_any_call(42, 'The add was successfully deleted.')
+
+
+def test_delete_unknown_add_asks_again(mock_bot, clean_schedule):
+    job = main.schedule_add(7, 100, 'Buy now!', 'minute', ':00')
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.fetchone.return_value = None
+
+    with mock_db(mock_connection):
+        main.delete_add(make_message('9'))
+
+    assert main.schedule_jobs == {7: job}
+    assert main.conversation_steps[42] == (main.delete_add, ())
+
+
+def test_login_rehashes_plain_text_password(mock_bot):
+    found_user = main.User((5, 'test_user', 'password123', False))
+    mock_connection = MagicMock()
+    mock_cursor = mock_connection.cursor.return_value
+
+    with mock_db(mock_connection):
+        main.process_password_step(make_message('password123'), found_user)
+
+    assert found_user.check_password('password123') and not found_user.needs_rehash()
+    mock_cursor.execute.assert_called_once_with('UPDATE users SET password = %s WHERE id = %s',
+                                                (found_user.password, 5))
+    assert main.sessions[42] is found_user
+
+
+def test_login_with_wrong_password(mock_bot):
+    found_user = main.User((5, 'test_user', 'scrypt$not_hex$00', False))
+    mock_connection = MagicMock()
+
+    with mock_db(mock_connection):
+        main.process_password_step(make_message('password123'), found_user)
+
+    mock_connection.cursor.return_value.execute.assert_not_called()
+    assert 42 not in main.sessions
+    assert main.conversation_steps[42] == (main.process_password_step, (found_user,))
+
+
+def test_run_webhook_registers_secret_token(mock_bot):
+    webhook_config = Config(token='test_token', db_config={}, webhook_url='https://example.com/bot/')
+
+    with patch.object(main, 'config', webhook_config), patch.object(main, 'WebhookServer') as mock_server_class:
+        main.run_webhook()
+
+    secret_token = mock_bot.set_webhook.call_args.kwargs['secret_token']
+    assert len(secret_token) >= 32
+    mock_bot.set_webhook.assert_called_once_with(url='https://example.com/bot/test_token', secret_token=secret_token)
+    mock_server_class.assert_called_once_with(mock_bot, '127.0.0.1', 8443, '/test_token', secret_token)
+    mock_server_class.return_value.serve_forever.assert_called_once()
+
+
+def test_failed_startup_does_not_start_schedule_thread():
+    # the globals set up by `main` are restored after the test
+    with patch.multiple(main, config=None, bot=None, sender=None, schedule_thread=None), \
+            patch.object(main.sys, 'argv', ['main.py', 'config.json']), \
+            patch.object(main, 'load_config', return_value=Config(token='test_token', db_config={})), \
+            patch.object(main.telebot, 'TeleBot'), patch.object(main, 'RateLimitedSender'), \
+            patch.object(main, 'init_pool'), patch.object(main.threading, 'Thread') as mock_thread_class, \
+            patch.object(main, 'create_tables', side_effect=RuntimeError('duplicate logins')):
+        with pytest.raises(RuntimeError):
+            main.main()
+
+    mock_thread_class.assert_not_called()
+
+
+def test_new_user_with_taken_login(mock_bot):
+    new_user = main.User((None, 'test_user', main.User.hash_password('password123'), None))
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.execute.side_effect = UniqueViolation()
+
+    with mock_db(mock_connection):
+        main.process_new_is_admin(make_message('No'), new_user)
+
+    mock_bot.send_message.assert_called_once_with(42, 'User with this login already exists. Try again:')
+    assert main.conversation_steps[42] == (main.process_new_login, (new_user,))
+
+
+def test_new_add_is_saved_and_scheduled(mock_bot, clean_schedule):
+    new_add = main.Add((None, 'test_user', 100, 'Buy now!', 'day', None))
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.fetchone.return_value = (7,)
+
+    with mock_db(mock_connection):
+        main.process_new_time_day(make_message('10:30'), new_add)
+
+    assert main.schedule_jobs[7].at_time.hour == 10
+    mock_bot.send_message.assert_any_call(42, 'Your add was successfully saved!')
+
+
+def test_new_add_with_invalid_time_is_not_saved(mock_bot, clean_schedule):
+    new_add = main.Add((None, 'test_user', 100, 'Buy now!', 'day', None))
+    mock_connection = MagicMock()
+    mock_connection.cursor.return_value.fetchone.return_value = (7,)
+    committed = []
+
+    @contextmanager
+    def db(read_only=False):
+        # like `main.db`, the insert is committed only if the block finishes without an exception
+        yield mock_connection, mock_connection.cursor.return_value
+        committed.append(True)
+
+    with patch.object(main, 'db', db):
+        main.process_new_time_day(make_message('9:00'), new_add)
+
+    assert not committed
+    assert main.schedule_jobs == {}
+    mock_bot.send_message.assert_called_once_with(42, 'Hmm... Wrong format of the time. Try again:')
+    assert main.conversation_steps[42] == (main.process_new_time_day, (new_add,))
+
+
+def make_call(data, chat_id=42):
+    call = MagicMock()
+    call.data = data
+    call.message.chat.id = chat_id
+    return call
+
+
+def test_callback_without_session(mock_bot):
+    for data in ('display_users', 'new_user', 'delete_user', 'new_add', 'display_adds', 'delete_add'):
+        main.handle_callback_query(make_call(data))
+
+    assert mock_bot.send_message.call_count == 6
+    mock_bot.send_message.assert_called_with(42, 'You are not logged in. Write /start to log in.')
+    assert main.conversation_steps == {}
+
+
+def test_admin_callback_of_user(mock_bot):
+    main.sessions[42] = main.User((5, 'test_user', 'password123', False))
+
+    with patch.object(main, 'db') as mock_db_function:
+        for data in ('display_users', 'new_user', 'delete_user', 'back_admin'):
+            main.handle_callback_query(make_call(data))
+
+    mock_db_function.assert_not_called()
+    mock_bot.send_message.assert_called_with(42, 'Only an admin can do that.')
+    assert main.conversation_steps == {}
+
+
+def test_new_add_callback_uses_session(mock_bot):
+    main.sessions[42] = main.User((5, 'test_user', 'password123', False))
+
+    main.handle_callback_query(make_call('new_add'))
+
+    step, (new_add,) = main.conversation_steps[42]
+    assert step is main.process_new_chat_id
+    assert new_add.login == 'test_user'
+
+
+def test_exit_callback_without_session(mock_bot):
+    main.handle_callback_query(make_call('exit'))
+
+    mock_bot.send_message.assert_called_once_with(42, 'You have logged out. Write /start if you want to log in.')
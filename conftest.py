@@ -0,0 +1,16 @@
+"""
+Configuration of pytest shared by all tests.
+
+The tests import the helpers as the `app` package, so the root of the repository is put on the import path
+(also when pytest is started by the `pytest` command, which, unlike `python -m pytest`, does not add it).
+The server script imports the helpers as a top level package, so `app/src` is put on it as well (the tests
+of the server script import them the same way, so they test the very modules the server uses).
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+for path in (ROOT, os.path.join(ROOT, 'app', 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)